@@ -0,0 +1,78 @@
+from django.utils.cache import patch_cache_control
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from accounts.models import User
+from courses.models import Course, Provider
+from flamingo.caching import LRUCache
+from flamingo.routers import ReplicaRoutingMixin
+from flamingo.search import search
+from organisations.models import Organisation
+
+TYPEAHEAD_LIMIT = 10
+# Suggestions may be this many seconds old, in the browser and in the process
+TYPEAHEAD_MAX_AGE = 30
+
+typeahead_cache = LRUCache(maxsize=512, ttl=TYPEAHEAD_MAX_AGE)
+
+
+class TypeaheadView(ReplicaRoutingMixin, APIView):
+    """
+    Suggest objects whose fields contain the ?q= term, as a short list of id and label.
+
+    Only the columns needed for the label are read, and results are kept briefly in a
+    per-process LRU so the same prefix typed by different users is only queried once.
+    """
+    queryset = None
+    search_fields = []
+    label_fields = []
+    limit = TYPEAHEAD_LIMIT
+
+    def get_label(self, values):
+        return ' '.join(str(values[field]) for field in self.label_fields if values[field])
+
+    def get_suggestions(self, query):
+        queryset = search(self.queryset.all(), query, self.search_fields)
+        rows = queryset.values('id', *self.label_fields)[:self.limit]
+        return [{'id': row['id'], 'label': self.get_label(row)} for row in rows]
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        suggestions = []
+        if query:
+            key = (type(self).__name__, query.lower())
+            suggestions = typeahead_cache.get(key)
+            if suggestions is None:
+                suggestions = self.get_suggestions(query)
+                typeahead_cache.set(key, suggestions)
+        response = Response(suggestions)
+        patch_cache_control(response, private=True, max_age=TYPEAHEAD_MAX_AGE)
+        return response
+
+
+class OrganisationTypeahead(TypeaheadView):
+    queryset = Organisation.objects.order_by('name', 'id')
+    search_fields = ['name']
+    label_fields = ['name']
+
+
+class UserTypeahead(TypeaheadView):
+    queryset = User.objects.order_by('last_name', 'first_name', 'id')
+    search_fields = ['first_name', 'last_name', 'email']
+    label_fields = ['first_name', 'last_name', 'email']
+
+    def get_label(self, values):
+        name = ' '.join(values[field] for field in ['first_name', 'last_name'] if values[field])
+        return '{} ({})'.format(name, values['email']) if name else values['email']
+
+
+class CourseTypeahead(TypeaheadView):
+    queryset = Course.objects.order_by('title', 'id')
+    search_fields = ['title']
+    label_fields = ['title']
+
+
+class ProviderTypeahead(TypeaheadView):
+    queryset = Provider.objects.order_by('name', 'id')
+    search_fields = ['name']
+    label_fields = ['name']
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class FlamingoConfig(AppConfig):
     name = 'flamingo'
+
+    def ready(self):
+        # Connect the signal receivers
+        from flamingo import signals  # noqa: F401
@@ -0,0 +1,195 @@
+import json
+import math
+import statistics
+import time
+
+from django.core.signals import request_started
+from django.db import reset_queries
+from django.db.models import Count
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from accounts.models import User
+from courses.models import Course, Curriculum, Provider, Qualification
+from flamingo import urls
+from flamingo.instrumentation import QueryRecorder
+from organisations.models import Member, Organisation, Role, RoleRequirements
+
+# Routes which need something that cannot be looked up, such as a running import, or only take posts
+SKIPPED_ROUTES = {'org-members-import-progress', 'org-members-unlink', 'org-requirements-delete', 'org-roles-delete'}
+
+# The object each url argument stands for; "pk" depends on the kind of page
+ARGUMENTS = {
+    'org_id': 'org',
+    'member_pk': 'member',
+    'member_id': 'member',
+    'user_id': 'user',
+    'requirement_pk': 'requirement',
+    'role_pk': 'role',
+    'document_pk': 'document',
+    'course_pk': 'course',
+    'provider_pk': 'provider',
+}
+PK_ARGUMENTS = {'org': 'org', 'user': 'user', 'curriculums': 'curriculum'}
+
+# Differences below this are noise on the fastest pages, whatever the tolerance
+MIN_REGRESSION_MS = 1.0
+
+# The search pages and typeaheads are given a term which matches some of the data
+QUERIES = {
+    'org-list': ('org', 'org_name'),
+    'org-typeahead': ('q', 'org_name'),
+    'org-users-list': ('user_search', 'user_name'),
+    'user-list': ('usr', 'user_name'),
+    'user-typeahead': ('q', 'user_name'),
+    'curriculums-list': ('search', 'course_title'),
+    'courses-list': ('search', 'course_title'),
+    'courses-typeahead': ('q', 'course_title'),
+    'providers-list': ('search', 'provider_name'),
+    'providers-typeahead': ('q', 'provider_name'),
+}
+
+
+def percentile(values, percent):
+    """
+    The nearest-rank percentile of a list of numbers.
+    """
+    values = sorted(values)
+    return values[max(int(math.ceil(percent / 100 * len(values))) - 1, 0)]
+
+
+def first_word(value):
+    return value.split()[0] if value else ''
+
+
+class RouteSamples(object):
+    """
+    The objects the flamingo routes are benchmarked with, taken from the organisation with the
+    most members so the pages show as much data as the dataset has.
+    """
+    def __init__(self):
+        largest = (Member.objects.values('organisation').annotate(members=Count('id'))
+                   .order_by('-members', 'organisation').first())
+        organisation = Organisation.objects.filter(id=largest['organisation']).first() if largest else None
+        member = Member.objects.filter(organisation=organisation).select_related('user').order_by('id').first()
+        user = member.user if member else User.objects.order_by('id').first()
+        course = Course.objects.order_by('id').first()
+        provider = Provider.objects.order_by('id').first()
+        self.values = {
+            'org': organisation.id if organisation else None,
+            'member': member.id if member else None,
+            'user': user.id if user else None,
+            'requirement': self.first_id(RoleRequirements.objects.filter(organisation=organisation)),
+            'role': self.first_id(Role.objects.filter(organisation=organisation)),
+            'document': self.first_id(Qualification.objects.filter(user=user)),
+            'curriculum': self.first_id(Curriculum.objects.all()),
+            'course': course.id if course else None,
+            'provider': provider.id if provider else None,
+            'org_name': first_word(organisation.name if organisation else ''),
+            'user_name': user.last_name if user else '',
+            'course_title': first_word(course.title if course else ''),
+            'provider_name': first_word(provider.name if provider else ''),
+        }
+
+    @staticmethod
+    def first_id(queryset):
+        return queryset.order_by('id').values_list('id', flat=True).first()
+
+    def url(self, pattern):
+        """
+        Return the url to benchmark a route with, or None if there is nothing to show on it.
+        """
+        name = pattern.name
+        kwargs = {}
+        for argument in pattern.regex.groupindex:
+            kind = PK_ARGUMENTS.get(name.split('-')[0]) if argument == 'pk' else ARGUMENTS.get(argument)
+            if self.values.get(kind) is None:
+                return None
+            kwargs[argument] = self.values[kind]
+        url = reverse('flamingo:' + name, kwargs=kwargs)
+        if name in QUERIES:
+            parameter, kind = QUERIES[name]
+            url += '?' + urlencode({parameter: self.values[kind]})
+        return url
+
+
+def routes():
+    """
+    The flamingo url patterns to benchmark, in the order of flamingo.urls.
+    """
+    return [pattern for pattern in urls.urlpatterns if pattern.name not in SKIPPED_ROUTES]
+
+
+def run_route(client, url, runs):
+    """
+    Request a url repeatedly and return its median and p95 latency in milliseconds, its query
+    count and status code. The first request warms up the caches and is not counted.
+    """
+    # Each request would clear the query log the recorder counts from, as CaptureQueriesContext
+    # also prevents
+    request_started.disconnect(reset_queries)
+    try:
+        client.get(url)
+        timings = []
+        for _ in range(runs):
+            with QueryRecorder() as recorder:
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        request_started.connect(reset_queries)
+    return {
+        'url': url,
+        'status': response.status_code,
+        'median': round(statistics.median(timings), 2),
+        'p95': round(percentile(timings, 95), 2),
+        'queries': recorder.count,
+    }
+
+
+def run_benchmark(client, runs=20, only=None, log=None):
+    """
+    Benchmark every flamingo route, or the ones named in only, and return a dict of url name
+    to its results.
+    """
+    samples = RouteSamples()
+    results = {}
+    for pattern in routes():
+        if only and pattern.name not in only:
+            continue
+        url = samples.url(pattern)
+        if url is None:
+            continue
+        results[pattern.name] = run_route(client, url, runs)
+        if log:
+            log(pattern.name, results[pattern.name])
+    return results
+
+
+def save_baseline(results, path):
+    with open(path, 'w') as baseline:
+        json.dump(results, baseline, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as baseline:
+        return json.load(baseline)
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Return a list of (url name, description) for the routes which got slower than the
+    baseline by more than the tolerance (and MIN_REGRESSION_MS), or started running more queries.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for measure in ('median', 'p95'):
+            limit = max(before[measure] * (1 + tolerance), before[measure] + MIN_REGRESSION_MS)
+            if result[measure] > limit:
+                regressions.append((name, '{} {:.2f}ms -> {:.2f}ms'.format(measure, before[measure], result[measure])))
+        if result['queries'] > before['queries']:
+            regressions.append((name, 'queries {} -> {}'.format(before['queries'], result['queries'])))
+    return regressions
@@ -0,0 +1,39 @@
+from django.db.models import CASCADE, DO_NOTHING, PROTECT, SET_NULL, ProtectedError
+
+
+def dependent_relations(model):
+    """
+    The relations of the rows which point at a model, including the many-to-many through
+    tables (whose foreign keys are hidden relations of the model).
+    """
+    return [relation for relation in model._meta.get_fields(include_hidden=True)
+            if relation.auto_created and not relation.concrete and (relation.one_to_many or relation.one_to_one)]
+
+
+def delete_rows(queryset):
+    """
+    Delete the rows of a queryset with one set-based DELETE per table, and return how many
+    were deleted.
+
+    Rows which point at them are dealt with first according to their on_delete: many-to-many
+    through rows and other cascading rows are deleted the same way, SET_NULL keys are cleared
+    in a single UPDATE, and other handlers are not supported. Unlike QuerySet.delete(), the
+    rows are never loaded and no delete signals are sent, so the caller must do whatever the
+    signal handlers would have done.
+    """
+    for relation in dependent_relations(queryset.model):
+        if relation.on_delete is DO_NOTHING:
+            continue
+        related = relation.related_model._base_manager.filter(**{relation.field.name + '__in': queryset.values('pk')})
+        if relation.on_delete is PROTECT:
+            if related.exists():
+                raise ProtectedError('Cannot delete {} referenced through {}'.format(
+                    queryset.model._meta.verbose_name_plural, relation.field), related)
+        elif relation.on_delete is SET_NULL:
+            related.update(**{relation.field.name: None})
+        elif relation.on_delete is CASCADE:
+            delete_rows(related)
+        else:
+            raise ValueError('{} cannot be bulk deleted with on_delete={}'.format(
+                relation.field, relation.on_delete.__name__))
+    return queryset._raw_delete(queryset.db)
@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from courses.models import Course
+from flamingo.routers import read_primary_if_changed
+
+COURSE_CHOICES_KEY = 'flamingo:course-choices'
+# A course change only clears the list in the cache of the process which made it, so with a
+# per-process cache (LocMemCache) the other workers' lists are refreshed after this long
+COURSE_CHOICES_TIMEOUT = 5 * 60
+
+
+def course_choices():
+    """
+    Return (id, title) pairs for every course, ordered by title.
+
+    The list is kept in the configured cache until a course is saved or deleted, or for
+    settings.FLAMINGO_COURSE_CHOICES_TIMEOUT seconds at most.
+    """
+    choices = cache.get(COURSE_CHOICES_KEY)
+    if choices is None:
+        # Kept until the next course change, so it must not come from a replica behind the primary
+        choices = list(Course.objects.using(DEFAULT_DB_ALIAS).order_by('title').values_list('id', 'title'))
+        cache.set(COURSE_CHOICES_KEY, choices,
+                  getattr(settings, 'FLAMINGO_COURSE_CHOICES_TIMEOUT', COURSE_CHOICES_TIMEOUT))
+    return choices
+
+
+def invalidate_course_choices():
+    cache.delete(COURSE_CHOICES_KEY)
+
+
+def version_key(kind, pk):
+    return 'flamingo:{}-version:{}'.format(kind, pk)
+
+
+def initial_version():
+    # Versions are millisecond timestamps, so they also tell when the data last changed, and
+    # a counter evicted from the cache can never come back at a version still in use
+    return int(time.time() * 1000)
+
+
+def get_version(kind, pk):
+    """
+    Return the version of the data of an object, starting one if it has none yet. A version
+    which changed within the replica pin window moves the request's reads to the primary.
+    """
+    key = version_key(kind, pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, initial_version(), None)
+        version = cache.get(key, initial_version())
+    read_primary_if_changed([version])
+    return version
+
+
+def get_versions(kind, pks):
+    """
+    Return a dict of pk to version for several objects, in one cache round trip.
+    """
+    keys = {version_key(kind, pk): pk for pk in pks}
+    versions = {keys[key]: version for key, version in cache.get_many(list(keys)).items()}
+    for pk in pks:
+        if pk not in versions:
+            versions[pk] = get_version(kind, pk)
+    read_primary_if_changed(versions.values())
+    return versions
+
+
+def bump_version(kind, pk):
+    """
+    Move an object's data to a new version once the current transaction commits.
+    """
+    def bump():
+        key = version_key(kind, pk)
+        cache.set(key, max(initial_version(), (cache.get(key) or 0) + 1), None)
+    transaction.on_commit(bump)
+
+
+def organisation_version(org_id):
+    """
+    Return the version of an organisation's cached template fragments.
+    """
+    return get_version('org', org_id)
+
+
+def bump_organisation_version(org_id):
+    """
+    Move an organisation's fragments to a new version once the current transaction commits,
+    so the next request renders them again from the database.
+    """
+    bump_version('org', org_id)
+
+
+def user_version(user_id):
+    return get_version('user', user_id)
+
+
+def bump_user_version(user_id):
+    bump_version('user', user_id)
+
+
+class LRUCache(object):
+    """
+    Small thread-safe in-process cache which drops the least recently used entry when full.
+    Entries also expire after ttl seconds, so changes show up without invalidation.
+    """
+    def __init__(self, maxsize=256, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,208 @@
+from collections import defaultdict, namedtuple
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Q
+
+from courses.models import Qualification
+from flamingo.models import ComplianceStatus
+from organisations.models import Member, Organisation, RoleRequirements
+
+# Qualifications with these statuses count towards a requirement until their expiry date
+VALID_STATUSES = ['VERIFIED']
+
+ComplianceRow = namedtuple('ComplianceRow', ['member_id', 'user_id', 'first_name', 'last_name', 'email',
+                                             'statuses', 'compliant'])
+
+
+class ComplianceMatrix(object):
+    """
+    The requirements of an organisation and, for each member, whether they meet them.
+
+    Each row's statuses line up with the requirements: None when the requirement does not
+    apply to any of the member's roles, otherwise whether they hold a valid qualification
+    for the primary course or one of its alternatives.
+    """
+    def __init__(self, requirements, rows, compliant_count=None, member_count=None):
+        self.requirements = requirements
+        self.rows = rows
+        # A matrix of one page of members is given the counts of the whole organisation
+        self.compliant_count = (compliant_count if compliant_count is not None
+                                else sum(1 for row in rows if row.compliant))
+        self.member_count = member_count if member_count is not None else len(rows)
+
+    @property
+    def compliance_rate(self):
+        if not self.member_count:
+            return 100
+        return round(100 * self.compliant_count / self.member_count)
+
+
+def pairs_to_sets(pairs):
+    grouped = defaultdict(set)
+    for key, value in pairs:
+        grouped[key].add(value)
+    return grouped
+
+
+def valid_qualifications(today):
+    return (Qualification.objects.filter(verification_status__in=VALID_STATUSES)
+            .filter(Q(expiry_date__isnull=True) | Q(expiry_date__gte=today)))
+
+
+def held_courses(qualifications):
+    """
+    Map each user to the courses they hold a valid qualification for, and the date the
+    longest lasting one expires (None if one never expires).
+    """
+    held = defaultdict(dict)
+    for user_id, course_id, expiry_date in qualifications.values_list('user_id', 'course_id', 'expiry_date'):
+        courses = held[user_id]
+        if course_id not in courses:
+            courses[course_id] = expiry_date
+        elif courses[course_id] is not None and (expiry_date is None or expiry_date > courses[course_id]):
+            courses[course_id] = expiry_date
+    return held
+
+
+class RequirementIndex(object):
+    """
+    The roles and courses of every requirement in an organisation, loaded in bulk.
+    """
+    def __init__(self, organisation):
+        self.role_requirements = pairs_to_sets(RoleRequirements.roles.through.objects
+                                               .filter(rolerequirements__organisation=organisation)
+                                               .values_list('role_id', 'rolerequirements_id'))
+        self.requirement_courses = pairs_to_sets(RoleRequirements.courses.through.objects
+                                                 .filter(rolerequirements__organisation=organisation)
+                                                 .values_list('rolerequirements_id', 'course_id'))
+
+    def applicable(self, role_ids):
+        requirement_ids = set()
+        for role_id in role_ids:
+            requirement_ids |= self.role_requirements[role_id]
+        return requirement_ids
+
+    def check(self, requirement_id, held):
+        """
+        Return whether the held courses meet a requirement, and until when (None if forever).
+        """
+        expiry_dates = [held[course_id] for course_id in self.requirement_courses[requirement_id] if course_id in held]
+        if not expiry_dates:
+            return False, None
+        if None in expiry_dates:
+            return True, None
+        return True, max(expiry_dates)
+
+
+def evaluate_compliance(organisation, today=None):
+    """
+    Work out the compliance of every member of an organisation.
+
+    A fixed number of set-based queries fetch the members, roles, requirements and valid
+    qualifications, which are then joined in memory.
+    """
+    today = today or date.today()
+    members = list(Member.objects.filter(organisation=organisation)
+                   .order_by('user__last_name', 'user__first_name', 'id')
+                   .values_list('id', 'user_id', 'user__first_name', 'user__last_name', 'user__email'))
+    requirements = list(RoleRequirements.objects.filter(organisation=organisation).order_by('name', 'id'))
+    member_roles = pairs_to_sets(Member.roles.through.objects.filter(member__organisation=organisation)
+                                 .values_list('member_id', 'role_id'))
+    index = RequirementIndex(organisation)
+    held = held_courses(valid_qualifications(today).filter(user__memberships__organisation=organisation).distinct())
+
+    rows = []
+    for member_id, user_id, first_name, last_name, email in members:
+        applicable = index.applicable(member_roles[member_id])
+        statuses = [index.check(requirement.id, held[user_id])[0] if requirement.id in applicable else None
+                    for requirement in requirements]
+        rows.append(ComplianceRow(member_id, user_id, first_name, last_name, email, statuses,
+                                  False not in statuses))
+    return ComplianceMatrix(requirements, rows)
+
+
+def compliance_members(organisation):
+    """
+    The members of an organisation in the order the compliance matrix lists them, as the
+    (id, user_id, first_name, last_name, email) tuples snapshot_matrix() takes.
+    """
+    return (Member.objects.filter(organisation=organisation)
+            .order_by('user__last_name', 'user__first_name', 'id')
+            .values_list('id', 'user_id', 'user__first_name', 'user__last_name', 'user__email'))
+
+
+def failing_statuses(organisation, today):
+    return (ComplianceStatus.objects.filter(organisation=organisation)
+            .filter(Q(compliant=False) | Q(valid_until__lt=today)))
+
+
+def snapshot_matrix(organisation, members=None, member_count=None, today=None):
+    """
+    Build the compliance matrix of an organisation from its ComplianceStatus snapshot.
+
+    Given a page of compliance_members() (and the number of members in all), only the
+    statuses of those members are read, and the compliant members are counted in the database.
+    """
+    today = today or date.today()
+    requirements = list(RoleRequirements.objects.filter(organisation=organisation).order_by('name', 'id'))
+    statuses = ComplianceStatus.objects.filter(organisation=organisation)
+    compliant_count = None
+    if members is None:
+        members = compliance_members(organisation)
+    else:
+        members = list(members)
+        statuses = statuses.filter(member_id__in=[member[0] for member in members])
+        compliant_count = (Member.objects.filter(organisation=organisation)
+                           .exclude(id__in=failing_statuses(organisation, today).values('member_id')).count())
+    snapshot = defaultdict(dict)
+    for member_id, requirement_id, compliant, valid_until in (
+            statuses.values_list('member_id', 'requirement_id', 'compliant', 'valid_until')):
+        snapshot[member_id][requirement_id] = compliant and (valid_until is None or valid_until >= today)
+
+    rows = []
+    for member_id, user_id, first_name, last_name, email in members:
+        statuses = [snapshot[member_id].get(requirement.id) for requirement in requirements]
+        rows.append(ComplianceRow(member_id, user_id, first_name, last_name, email, statuses,
+                                  False not in statuses))
+    return ComplianceMatrix(requirements, rows, compliant_count, member_count)
+
+
+def refresh_compliance(organisation, member_ids=None, today=None, batch_size=1000):
+    """
+    Recalculate the ComplianceStatus rows of an organisation, or of some of its members.
+
+    Qualifications which have already expired are left out; ones which expire later are
+    recorded with the date they stop counting, so the snapshot stays correct over time.
+    """
+    today = today or date.today()
+    with transaction.atomic():
+        # Refreshes of the same organisation take turns, so each reads the data the previous
+        # one committed and they never insert the same (member, requirement) row twice
+        list(Organisation.objects.select_for_update().filter(pk=organisation.pk).values_list('pk'))
+
+        members = Member.objects.filter(organisation=organisation)
+        member_roles = Member.roles.through.objects.filter(member__organisation=organisation)
+        qualifications = valid_qualifications(today).filter(user__memberships__organisation=organisation)
+        existing = ComplianceStatus.objects.filter(organisation=organisation)
+        if member_ids is not None:
+            members = members.filter(id__in=member_ids)
+            member_roles = member_roles.filter(member_id__in=member_ids)
+            qualifications = qualifications.filter(user__memberships__id__in=member_ids)
+            existing = existing.filter(member_id__in=member_ids)
+        members = list(members.values_list('id', 'user_id'))
+        member_roles = pairs_to_sets(member_roles.values_list('member_id', 'role_id'))
+        index = RequirementIndex(organisation)
+        held = held_courses(qualifications.distinct())
+
+        statuses = []
+        for member_id, user_id in members:
+            for requirement_id in index.applicable(member_roles[member_id]):
+                compliant, valid_until = index.check(requirement_id, held[user_id])
+                statuses.append(ComplianceStatus(organisation=organisation, member_id=member_id,
+                                                 requirement_id=requirement_id, compliant=compliant,
+                                                 valid_until=valid_until))
+
+        existing.delete()
+        ComplianceStatus.objects.bulk_create(statuses, batch_size=batch_size)
+    return len(statuses)
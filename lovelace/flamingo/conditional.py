@@ -0,0 +1,104 @@
+import hashlib
+from datetime import date, datetime, time, timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.views.decorators.http import condition
+
+from flamingo.caching import get_version, get_versions
+from organisations.models import Member
+
+
+def version_datetime(version):
+    # Versions are millisecond timestamps of the last change, see flamingo.caching. HTTP dates
+    # only have whole seconds, so this is the second the change was made in.
+    return datetime.fromtimestamp(version // 1000, timezone.utc)
+
+
+class ConditionalGetMixin(object):
+    """
+    Answer GET requests with 304 Not Modified when the client's copy is still current.
+
+    get_versions() returns (name, version) pairs for the data the page is built from: by
+    default the version of version_kind for the object named by the version_kwarg url
+    argument. The ETag hashes them and Last-Modified is the second of the newest, so
+    checking a request only costs the version lookups.
+    """
+    version_kind = None
+    version_kwarg = 'pk'
+    # Pages which count down to a date also change at midnight
+    daily = False
+
+    def get_versions(self):
+        if self.version_kind is None:
+            raise ImproperlyConfigured('{} needs a version_kind or a get_versions() method.'.format(
+                type(self).__name__))
+        pk = self.kwargs[self.version_kwarg]
+        return [('{}:{}'.format(self.version_kind, pk), get_version(self.version_kind, pk))]
+
+    @cached_property
+    def validators(self):
+        versions = list(self.get_versions())
+        parts = [type(self).__name__] + ['{}={}'.format(name, version) for name, version in versions]
+        last_modified = max(version_datetime(version) for name, version in versions)
+        if self.daily:
+            today = date.today()
+            parts.append(today.isoformat())
+            last_modified = max(last_modified, timezone.make_aware(datetime.combine(today, time())))
+        # Another change later in the same second would have the same Last-Modified, so it
+        # is only sent once that second is over; until then the ETag alone validates the page
+        if last_modified > datetime.now(timezone.utc) - timedelta(seconds=1):
+            last_modified = None
+        return hashlib.md5(':'.join(parts).encode('utf-8')).hexdigest(), last_modified
+
+    def get(self, request, *args, **kwargs):
+        return condition(etag_func=lambda *args, **kwargs: self.validators[0],
+                         last_modified_func=lambda *args, **kwargs: self.validators[1])(
+            super().get)(request, *args, **kwargs)
+
+
+class OrgConditionalGetMixin(ConditionalGetMixin):
+    """
+    Conditional GET for organisation pages, which change with the organisation's version.
+    """
+    version_kind = 'org'
+
+
+class MemberConditionalGetMixin(OrgConditionalGetMixin):
+    """
+    Conditional GET for member pages, which also show details of the member's user.
+    """
+    def get_versions(self):
+        versions = super().get_versions()
+        for user_id in Member.objects.filter(pk=self.kwargs['member_pk']).values_list('user_id', flat=True):
+            versions.append(('user:{}'.format(user_id), get_version('user', user_id)))
+        return versions
+
+
+class RoleConditionalGetMixin(OrgConditionalGetMixin):
+    """
+    Conditional GET for role pages, which also show details of the users holding the role.
+    """
+    def get_versions(self):
+        versions = super().get_versions()
+        user_ids = sorted(Member.objects.filter(organisation=self.kwargs['pk'], roles=self.kwargs['role_pk'])
+                          .values_list('user_id', flat=True))
+        versions += [('user:{}'.format(user_id), version) for user_id, version in
+                     sorted(get_versions('user', user_ids).items())]
+        return versions
+
+
+class UserConditionalGetMixin(ConditionalGetMixin):
+    """
+    Conditional GET for user pages, which change with the user and the organisations they
+    are a member of.
+    """
+    version_kind = 'user'
+
+    def get_versions(self):
+        org_ids = sorted(Member.objects.filter(user=self.kwargs['pk']).values_list('organisation_id', flat=True))
+        versions = super().get_versions()
+        versions += [('org:{}'.format(org_id), version) for org_id, version in
+                     sorted(get_versions('org', org_ids).items())]
+        return versions
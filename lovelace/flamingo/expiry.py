@@ -0,0 +1,130 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from notifications.signals import notify
+
+from accounts.models import User
+from courses.models import Qualification
+from flamingo.caching import bump_user_version
+from organisations.models import Member, Organisation
+
+EXPIRY_BATCH_SIZE = 500
+# Admins are warned about qualifications which expire within this many days
+EXPIRY_WARNING_DAYS = 30
+# The date of the last check, so each qualification is warned about once as it enters the warning period
+EXPIRY_LAST_RUN_KEY = 'flamingo:expiry:last-run'
+
+
+class ExpiryDigest(object):
+    """
+    Counts of the qualifications visible to each organisation which expired, or will soon,
+    collected batch by batch so one notification can be sent per admin.
+    """
+    def __init__(self):
+        self.expired = defaultdict(int)
+        self.expiring = defaultdict(int)
+
+    def add(self, counts, qualification_ids):
+        """
+        Count a batch of qualifications against the organisations each was made visible to.
+        """
+        through = Qualification.organisations.through
+        for org_id in (through.objects.filter(qualification_id__in=qualification_ids)
+                       .values_list('organisation_id', flat=True)):
+            counts[org_id] += 1
+
+    def describe(self, org_id, days):
+        parts = []
+        if self.expired[org_id]:
+            parts.append('{} qualification{} of your members expired'.format(
+                self.expired[org_id], '' if self.expired[org_id] == 1 else 's'))
+        if self.expiring[org_id]:
+            parts.append('{} will expire within {} days'.format(self.expiring[org_id], days))
+        return ' and '.join(parts) + '.'
+
+    def send(self, days):
+        """
+        Notify the admins of each organisation with expired or expiring qualifications.
+        """
+        org_ids = set(self.expired) | set(self.expiring)
+        admins = defaultdict(list)
+        for org_id, user_id in (Member.objects.filter(organisation__in=org_ids, level='ADMIN')
+                                .values_list('organisation_id', 'user_id')):
+            admins[org_id].append(user_id)
+        sent = 0
+        for organisation in Organisation.objects.filter(id__in=admins):
+            recipients = list(User.objects.filter(id__in=admins[organisation.id]))
+            notify.send(organisation, recipient=recipients, verb='qualification expiry digest',
+                        description=self.describe(organisation.id, days),
+                        expired=self.expired[organisation.id], expiring=self.expiring[organisation.id])
+            sent += len(recipients)
+        return sent
+
+
+def expire_qualifications(today, digest, batch_size=EXPIRY_BATCH_SIZE):
+    """
+    Mark verified qualifications which expired before today as EXPIRED.
+
+    Each batch is a range scan over the (verification_status, expiry_date) index followed by
+    a single UPDATE. Updated rows drop out of the range, so the next batch starts at the front again.
+    """
+    expired = 0
+    scan = (Qualification.objects.filter(verification_status='VERIFIED', expiry_date__lt=today)
+            .order_by('expiry_date', 'id'))
+    while True:
+        batch = list(scan.values_list('id', 'user_id')[:batch_size])
+        if not batch:
+            return expired
+        Qualification.objects.filter(id__in=[row[0] for row in batch]).update(verification_status='EXPIRED')
+        # The update sends no signals, so move the holders' pages to a new version here
+        for user_id in {row[1] for row in batch}:
+            bump_user_version(user_id)
+        digest.add(digest.expired, [row[0] for row in batch])
+        expired += len(batch)
+
+
+def scan_expiring_qualifications(today, days, digest, since=None, batch_size=EXPIRY_BATCH_SIZE):
+    """
+    Count the verified qualifications which entered the warning period since the last check,
+    i.e. expire after the given number of days from that check and no later than that many
+    days from today, seeking through the range by (expiry_date, id) one batch at a time.
+
+    The last check defaults to yesterday, so a daily run only reads the qualifications which
+    expire on the last day of the period, and every run after a missed one catches up.
+    """
+    since = since or today - timedelta(days=1)
+    expiring = 0
+    scan = (Qualification.objects.filter(verification_status='VERIFIED',
+                                         expiry_date__gt=since + timedelta(days=days),
+                                         expiry_date__lte=today + timedelta(days=days))
+            .order_by('expiry_date', 'id'))
+    last = None
+    while True:
+        queryset = scan
+        if last is not None:
+            queryset = queryset.filter(Q(expiry_date__gt=last[0]) | Q(expiry_date=last[0], id__gt=last[1]))
+        batch = list(queryset.values_list('expiry_date', 'id')[:batch_size])
+        if not batch:
+            return expiring
+        digest.add(digest.expiring, [row[1] for row in batch])
+        expiring += len(batch)
+        last = batch[-1][:2]
+
+
+def check_expiry(today=None, days=None, batch_size=EXPIRY_BATCH_SIZE):
+    """
+    Expire lapsed qualifications and send each organisation admin a digest of the ones which
+    expired and which entered the warning period since the last check.
+    """
+    today = today or date.today()
+    if days is None:
+        days = getattr(settings, 'FLAMINGO_EXPIRY_WARNING_DAYS', EXPIRY_WARNING_DAYS)
+    digest = ExpiryDigest()
+    expired = expire_qualifications(today, digest, batch_size)
+    expiring = scan_expiring_qualifications(today, days, digest, cache.get(EXPIRY_LAST_RUN_KEY), batch_size)
+    cache.set(EXPIRY_LAST_RUN_KEY, today, None)
+    notified = digest.send(days)
+    return {'expired': expired, 'expiring': expiring, 'notified': notified}
@@ -0,0 +1,126 @@
+import csv
+import json
+from collections import OrderedDict, defaultdict
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from courses.models import Qualification
+from organisations.models import Member, RoleRequirements
+
+# Rows are read through a server-side cursor and their related names are looked up one
+# chunk at a time, so memory use does not grow with the size of the export.
+EXPORT_CHUNK_SIZE = 2000
+
+MEMBER_COLUMNS = ['id', 'email', 'first_name', 'last_name', 'phone', 'level', 'roles', 'qualifications']
+REQUIREMENT_COLUMNS = ['id', 'name', 'primary', 'alternatives', 'roles']
+QUALIFICATION_COLUMNS = ['id', 'course', 'provider', 'verification_status', 'attained_date', 'expiry_date',
+                         'document_number', 'visible_to']
+
+
+def chunked(iterable, size=EXPORT_CHUNK_SIZE):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def group_names(pairs):
+    """
+    Group (key, name) pairs into a dict of key to a "; " separated string of names.
+    """
+    names = defaultdict(list)
+    for key, name in pairs:
+        names[key].append(str(name))
+    return defaultdict(str, {key: '; '.join(values) for key, values in names.items()})
+
+
+def member_rows(organisation):
+    members = (Member.objects.filter(organisation=organisation).order_by('id')
+               .values_list('id', 'user_id', 'user__email', 'user__first_name', 'user__last_name', 'user__phone',
+                            'level')
+               .iterator())
+    for chunk in chunked(members):
+        member_ids = [row[0] for row in chunk]
+        user_ids = [row[1] for row in chunk]
+        roles = group_names(Member.roles.through.objects.filter(member_id__in=member_ids)
+                            .order_by('role__name').values_list('member_id', 'role__name'))
+        qualifications = group_names(
+            (user_id, '{} ({})'.format(title, status)) for user_id, title, status in
+            Qualification.objects.filter(user__in=user_ids, organisations=organisation)
+            .order_by('course__title').values_list('user_id', 'course__title', 'verification_status'))
+        for member_id, user_id, email, first_name, last_name, phone, level in chunk:
+            yield [member_id, email, first_name, last_name, phone, level, roles[member_id], qualifications[user_id]]
+
+
+def requirement_rows(organisation):
+    requirements = (RoleRequirements.objects.filter(organisation=organisation).order_by('name', 'id')
+                    .values_list('id', 'name').iterator())
+    for chunk in chunked(requirements):
+        requirement_ids = [row[0] for row in chunk]
+        courses = defaultdict(list)
+        for requirement_id, title in (RoleRequirements.courses.through.objects
+                                      .filter(rolerequirements_id__in=requirement_ids)
+                                      .order_by('course__title').values_list('rolerequirements_id', 'course__title')):
+            courses[requirement_id].append(title)
+        roles = group_names(RoleRequirements.roles.through.objects.filter(rolerequirements_id__in=requirement_ids)
+                            .order_by('role__name').values_list('rolerequirements_id', 'role__name'))
+        for requirement_id, name in chunk:
+            # The primary document is the course the requirement is named after
+            titles = courses[requirement_id]
+            primary = name if name in titles else ''
+            alternatives = '; '.join(title for title in titles if title != name)
+            yield [requirement_id, name, primary, alternatives, roles[requirement_id]]
+
+
+def qualification_rows(user):
+    qualifications = (Qualification.objects.filter(user=user).order_by('id')
+                      .values_list('id', 'course__title', 'provider__name', 'verification_status', 'attained_date',
+                                   'expiry_date', 'document_number')
+                      .iterator())
+    for chunk in chunked(qualifications):
+        visible_to = group_names(Qualification.organisations.through.objects
+                                 .filter(qualification_id__in=[row[0] for row in chunk])
+                                 .order_by('organisation__name').values_list('qualification_id', 'organisation__name'))
+        for row in chunk:
+            yield list(row) + [visible_to[row[0]]]
+
+
+class Echo(object):
+    """
+    File-like object which hands back what is written to it, so csv.writer produces lines.
+    """
+    def write(self, value):
+        return value
+
+
+def stream_csv(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_json(columns, rows):
+    separator = '\n'
+    yield '['
+    for row in rows:
+        yield separator + json.dumps(OrderedDict(zip(columns, row)), cls=DjangoJSONEncoder)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def export_response(request, filename, columns, rows):
+    """
+    Stream rows as CSV, or as a JSON array when the request asks for ?format=json.
+    """
+    if request.GET.get('format') == 'json':
+        response = StreamingHttpResponse(stream_json(columns, rows), content_type='application/json')
+        extension = 'json'
+    else:
+        response = StreamingHttpResponse(stream_csv(columns, rows), content_type='text/csv')
+        extension = 'csv'
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(filename, extension)
+    return response
@@ -1,8 +1,11 @@
+import csv
+
 from django import forms
 from django.forms import Form, ModelForm, SelectMultiple, TextInput
 
 from accounts.models import User
-from courses.models import Course
+from flamingo.caching import course_choices
+from flamingo.imports import read_header
 from organisations.models import Member, Role
 
 
@@ -14,6 +17,8 @@ class AddMemberForm(ModelForm):
     # Only roles specific to the organisation shown
     def __init__(self, organisation, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # The organisation resolved for the request, shared rather than loaded again
+        self.organisation = organisation
         self.fields['roles'].widget = SelectMultiple(attrs={
           'class': 'form-control'
           })
@@ -47,13 +52,11 @@ class AddRequirementForm(Form):
 
     def __init__(self, org, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        courses = Course.objects.all().order_by('title')
-        self.fields['alternatives'].choices = courses.values_list('id', 'title')
+        courses = course_choices()
+        self.fields['alternatives'].choices = courses
         # Remove courses that are already "primary documents"
-        current_reqs = org.role_requirements.all()
-        for req in current_reqs:
-            courses = courses.exclude(title=req.name)
-        self.fields['primary'].choices = courses.values_list('id', 'title')
+        primaries = set(org.role_requirements.values_list('name', flat=True))
+        self.fields['primary'].choices = [(pk, title) for pk, title in courses if title not in primaries]
         self.fields['roles'].choices = org.roles.values_list('id', 'name')
 
 
@@ -64,13 +67,11 @@ class EditRequirementForm(Form):
 
     def __init__(self, org, current_req, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        courses = Course.objects.all().order_by('title')
-        self.fields['alternatives'].choices = courses.values_list('id', 'title')
-        current_reqs = org.role_requirements.all()
-        for req in current_reqs:
-            if req != current_req:
-                courses = courses.exclude(title=req.name)
-        self.fields['primary'].choices = courses.values_list('id', 'title')
+        courses = course_choices()
+        self.fields['alternatives'].choices = courses
+        # Remove courses that are the "primary document" of another requirement
+        primaries = set(org.role_requirements.exclude(pk=current_req.pk).values_list('name', flat=True))
+        self.fields['primary'].choices = [(pk, title) for pk, title in courses if title not in primaries]
         self.fields['roles'].choices = org.roles.values_list('id', 'name')
 
 
@@ -93,6 +94,7 @@ class SelectRoleRequirementsForm(Form):
 
     def __init__(self, org, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.organisation = org
         reqs = org.role_requirements.all()
         self.fields['requirements'].widget = SelectMultiple(attrs={
             'id': 'selectRequirements',
@@ -100,3 +102,18 @@ class SelectRoleRequirementsForm(Form):
         })
 
         self.fields['requirements'].choices = reqs.values_list('id', 'name')
+
+
+class ImportMembersForm(Form):
+    csv_file = forms.FileField(label='CSV file')
+
+    def clean_csv_file(self):
+        csv_file = self.cleaned_data['csv_file']
+        try:
+            header = read_header(csv_file)
+        except (UnicodeDecodeError, csv.Error):
+            raise forms.ValidationError('The file must be a CSV saved as UTF-8.')
+        if 'email' not in header:
+            raise forms.ValidationError('The first line of the file must name the columns, including "email".')
+        csv_file.seek(0)
+        return csv_file
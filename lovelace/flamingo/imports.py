@@ -0,0 +1,183 @@
+import codecs
+import csv
+
+from django.contrib.auth.base_user import BaseUserManager
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from accounts.models import User
+from flamingo.caching import bump_organisation_version
+from flamingo.compliance import refresh_compliance
+from organisations.models import Member
+
+IMPORT_COLUMNS = ['email', 'first_name', 'last_name', 'phone', 'level', 'roles']
+BATCH_SIZE = 1000
+# Only the first errors are kept in the progress report so it stays small
+MAX_ERRORS = 100
+PROGRESS_TIMEOUT = 60 * 60 * 24
+
+
+def progress_key(import_id):
+    return 'flamingo:member-import:{}'.format(import_id)
+
+
+def get_progress(import_id):
+    return cache.get(progress_key(import_id))
+
+
+def set_progress(import_id, progress):
+    cache.set(progress_key(import_id), progress, PROGRESS_TIMEOUT)
+
+
+def read_header(csv_file):
+    """
+    Return the lower-cased column names in the first line of an uploaded CSV.
+    """
+    reader = csv.reader(codecs.iterdecode(csv_file, 'utf-8-sig'))
+    return [column.strip().lower() for column in next(reader, [])]
+
+
+class MemberImporter(object):
+    """
+    Import the members of an organisation from a CSV of email, first_name, last_name, phone,
+    level and roles (role names separated by ";").
+
+    Rows are read and validated in a single pass and written in batches: existing users are
+    matched by email, missing users and members are bulk created, and member roles are
+    inserted straight into the through table. The compliance snapshot of the new members
+    is refreshed with each batch.
+    """
+    def __init__(self, organisation, import_id=None, batch_size=BATCH_SIZE):
+        self.organisation = organisation
+        self.import_id = import_id
+        self.batch_size = batch_size
+        self.roles = {role.name.strip().lower(): role.id for role in organisation.roles.all()}
+        self.levels = {}
+        for value, label in Member._meta.get_field('level').choices:
+            self.levels[str(value).lower()] = value
+            self.levels[str(label).lower()] = value
+        # A blank level is a plain member, shown as "Person" in the member forms
+        self.levels.update({'': '', 'person': '', 'member': ''})
+        self.seen_emails = set()
+        self.progress = {
+            'organisation': organisation.id,
+            'status': 'RUNNING',
+            'rows': 0,
+            'users_created': 0,
+            'members_created': 0,
+            'already_members': 0,
+            'invalid': 0,
+            'errors': [],
+        }
+
+    def run(self, lines):
+        """
+        Import the rows from an iterable of CSV text lines, including the header.
+        """
+        batch = []
+        for line_number, row in enumerate(csv.DictReader(lines), start=2):
+            self.progress['rows'] += 1
+            cleaned = self.clean_row(line_number, row)
+            if cleaned is not None:
+                batch.append(cleaned)
+            if len(batch) >= self.batch_size:
+                self.save_batch(batch)
+                batch = []
+        if batch:
+            self.save_batch(batch)
+        self.progress['status'] = 'DONE'
+        self.report()
+        return self.progress
+
+    def report(self):
+        if self.import_id is not None:
+            set_progress(self.import_id, self.progress)
+
+    def error(self, line_number, message):
+        self.progress['invalid'] += 1
+        if len(self.progress['errors']) < MAX_ERRORS:
+            self.progress['errors'].append('Line {}: {}'.format(line_number, message))
+
+    def clean_row(self, line_number, row):
+        row = {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+        email = BaseUserManager.normalize_email(row.get('email', ''))
+        try:
+            validate_email(email)
+        except ValidationError:
+            self.error(line_number, 'invalid email address "{}"'.format(email))
+            return None
+        if email.lower() in self.seen_emails:
+            self.error(line_number, '{} appears more than once'.format(email))
+            return None
+
+        level = row.get('level', '').lower()
+        if level not in self.levels:
+            self.error(line_number, 'unknown level "{}"'.format(row.get('level')))
+            return None
+
+        role_ids = set()
+        for name in row.get('roles', '').split(';'):
+            name = name.strip().lower()
+            if not name:
+                continue
+            if name not in self.roles:
+                self.error(line_number, 'unknown role "{}"'.format(name))
+                return None
+            role_ids.add(self.roles[name])
+
+        self.seen_emails.add(email.lower())
+        return {
+            'email': email,
+            'first_name': row.get('first_name', ''),
+            'last_name': row.get('last_name', ''),
+            'phone': row.get('phone', ''),
+            'level': self.levels[level],
+            'roles': role_ids,
+        }
+
+    @staticmethod
+    def user_ids(emails):
+        """
+        Return a dict of lowercased email to user id for the users with any of the emails,
+        whatever the case they were registered with.
+        """
+        return dict(User.objects.annotate(email_lower=Lower('email'))
+                    .filter(email_lower__in=[email.lower() for email in emails])
+                    .values_list('email_lower', 'id'))
+
+    @transaction.atomic
+    def save_batch(self, rows):
+        users = self.user_ids([row['email'] for row in rows])
+
+        new_users = [User(email=row['email'], first_name=row['first_name'], last_name=row['last_name'],
+                          phone=row['phone']) for row in rows if row['email'].lower() not in users]
+        if new_users:
+            User.objects.bulk_create(new_users)
+            # Not every database returns primary keys from a bulk insert, so read them back
+            users.update(self.user_ids([user.email for user in new_users]))
+            self.progress['users_created'] += len(new_users)
+
+        existing = set(Member.objects.filter(organisation=self.organisation, user__in=list(users.values()))
+                       .values_list('user_id', flat=True))
+        new_rows = [row for row in rows if users[row['email'].lower()] not in existing]
+        self.progress['already_members'] += len(rows) - len(new_rows)
+
+        if new_rows:
+            Member.objects.bulk_create([
+                Member(user_id=users[row['email'].lower()], organisation=self.organisation, level=row['level'])
+                for row in new_rows])
+            members = dict(Member.objects.filter(organisation=self.organisation,
+                                                 user__in=[users[row['email'].lower()] for row in new_rows])
+                           .values_list('user_id', 'id'))
+            through = Member.roles.through
+            through.objects.bulk_create([
+                through(member_id=members[users[row['email'].lower()]], role_id=role_id)
+                for row in new_rows for role_id in row['roles']])
+            # The bulk inserts send no signals, so bring the compliance snapshot up to date here
+            refresh_compliance(self.organisation, list(members.values()))
+            bump_organisation_version(self.organisation.id)
+            self.progress['members_created'] += len(new_rows)
+        self.report()
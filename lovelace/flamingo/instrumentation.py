@@ -0,0 +1,159 @@
+import hashlib
+import itertools
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+# Literals are stripped from SQL before fingerprinting so that the same statement run
+# with different parameters (the signature of an N+1 loop) shares one fingerprint.
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST = re.compile(r'\bIN \((?:\?, )*\?\)', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalise_sql(sql):
+    """
+    Replace the literals in a SQL statement with placeholders.
+    """
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = IN_LIST.sub('IN (...)', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    """
+    Short, stable identifier for the shape of a SQL statement.
+    """
+    return hashlib.md5(normalise_sql(sql).encode('utf-8')).hexdigest()[:12]
+
+
+class QueryRecorder(object):
+    """
+    Record the SQL run against every configured database while the context is active.
+    """
+    def __init__(self, using=None):
+        self.aliases = [using] if using else list(connections)
+        self.queries = []
+        self._state = {}
+        self._live = {}
+        self._live_time = 0.0
+
+    def __enter__(self):
+        for alias in self.aliases:
+            connection = connections[alias]
+            self._state[alias] = (connection.force_debug_cursor, len(connection.queries_log))
+            connection.force_debug_cursor = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for alias, (force_debug_cursor, start) in self._state.items():
+            connection = connections[alias]
+            connection.force_debug_cursor = force_debug_cursor
+            for query in list(connection.queries_log)[start:]:
+                self.queries.append(dict(query, alias=alias))
+        self._state = {}
+        self._live = {}
+
+    def live_db_time(self):
+        """
+        Time spent in the database so far while the context is still active, in seconds. Only
+        the queries logged since the last call are added up.
+        """
+        for alias, (force_debug_cursor, start) in self._state.items():
+            queries_log = connections[alias].queries_log
+            new = max(len(queries_log) - self._live.get(alias, start), 0)
+            self._live_time += sum(float(query['time']) for query in itertools.islice(reversed(queries_log), new))
+            self._live[alias] = len(queries_log)
+        return self._live_time
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def db_time(self):
+        """
+        Total time spent in the database, in seconds.
+        """
+        return sum(float(query['time']) for query in self.queries)
+
+    def fingerprints(self):
+        return Counter(fingerprint(query['sql']) for query in self.queries)
+
+    def duplicates(self):
+        """
+        Map the fingerprint of each statement run more than once to its normalised SQL and count.
+        """
+        counts = self.fingerprints()
+        duplicates = OrderedDict()
+        for query in self.queries:
+            key = fingerprint(query['sql'])
+            if counts[key] > 1 and key not in duplicates:
+                duplicates[key] = (normalise_sql(query['sql']), counts[key])
+        return duplicates
+
+
+_template_timing = threading.local()
+
+
+class TemplateTimer(object):
+    """
+    Add up the time spent rendering templates while the context is active, on this thread.
+
+    Only renders through TimedDjangoTemplates are timed. Given the active QueryRecorder,
+    queries run by the templates are left out, so template and database time do not overlap.
+    """
+    def __init__(self, recorder=None):
+        self.recorder = recorder
+        self.elapsed = 0.0
+        self.depth = 0
+
+    def db_time(self):
+        return self.recorder.live_db_time() if self.recorder is not None else 0.0
+
+    def __enter__(self):
+        self.previous = getattr(_template_timing, 'timer', None)
+        _template_timing.timer = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _template_timing.timer = self.previous
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timer = getattr(_template_timing, 'timer', None)
+        if timer is None:
+            return super().render(context, request)
+        # Templates rendered while rendering another are already inside its time
+        timer.depth += 1
+        if timer.depth == 1:
+            start, db_start = time.perf_counter(), timer.db_time()
+        try:
+            return super().render(context, request)
+        finally:
+            timer.depth -= 1
+            if not timer.depth:
+                timer.elapsed += time.perf_counter() - start - (timer.db_time() - db_start)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, with rendering timed for the flamingo metrics. Use it as
+    the BACKEND in settings.TEMPLATES; with the stock backend template time counts as Python time.
+    """
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
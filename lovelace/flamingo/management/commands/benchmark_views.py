@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from accounts.models import User
+from flamingo import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Time every flamingo page through the test client against the current database, reporting '
+            'median and p95 latency and query counts, and compare them with a saved baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=20, help='timed requests to each page')
+        parser.add_argument('--route', nargs='+', dest='routes', help='url names of the pages to time')
+        parser.add_argument('--save', help='write the results to this baseline file')
+        parser.add_argument('--compare', help='fail if the results are worse than this baseline file')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='how much slower than the baseline a page may get, as a fraction')
+
+    def handle(self, *args, **options):
+        baseline = benchmark.load_baseline(options['compare']) if options['compare'] else None
+        client = Client()
+        # The staff pages are benchmarked too
+        staff = User.objects.filter(is_staff=True, is_active=True).order_by('id').first()
+        if staff is not None:
+            client.force_login(staff)
+
+        self.stdout.write('{:<32} {:>6} {:>10} {:>10} {:>8}'.format(
+            'view', 'status', 'median ms', 'p95 ms', 'queries'))
+
+        def log(name, result):
+            self.stdout.write('{:<32} {:>6} {:>10.2f} {:>10.2f} {:>8}'.format(
+                name, result['status'], result['median'], result['p95'], result['queries']))
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            results = benchmark.run_benchmark(client, runs=options['runs'], only=options['routes'], log=log)
+
+        if options['save']:
+            benchmark.save_baseline(results, options['save'])
+            self.stdout.write('Saved the baseline to {}.'.format(options['save']))
+        if baseline is not None:
+            regressions = benchmark.compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Slower than the baseline:\n' + '\n'.join(
+                    '{}: {}'.format(name, description) for name, description in regressions))
+            self.stdout.write('No regressions against {}.'.format(options['compare']))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from flamingo.synthetic import BATCH_SIZE, DatasetGenerator
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a synthetic dataset of organisations, members and qualifications.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organisations', type=int, default=10, help='number of organisations')
+        parser.add_argument('--users', type=int, default=1000, help='number of users')
+        parser.add_argument('--members', type=int, default=50, help='members in each organisation')
+        parser.add_argument('--roles', type=int, default=5, help='roles in each organisation')
+        parser.add_argument('--requirements', type=int, default=5, help='requirements in each organisation')
+        parser.add_argument('--courses', type=int, default=20, help='number of courses')
+        parser.add_argument('--providers', type=int, default=10, help='number of providers')
+        parser.add_argument('--qualifications', type=int, help='number of qualifications (default 10 per user)')
+        parser.add_argument('--seed', type=int, help='seed for a repeatable dataset')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, dest='batch_size',
+                            help='rows written per insert')
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        generator = DatasetGenerator(
+            organisations=options['organisations'], users=options['users'], members=options['members'],
+            roles=options['roles'], requirements=options['requirements'], courses=options['courses'],
+            providers=options['providers'], qualifications=options['qualifications'], seed=options['seed'],
+            batch_size=options['batch_size'], log=log)
+        created = generator.generate()
+        self.stdout.write('Created {}.'.format(', '.join(
+            '{} {}'.format(count, kind) for kind, count in sorted(created.items()))))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from flamingo.compliance import refresh_compliance
+from organisations.models import Organisation
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the compliance snapshot of every organisation, or of the ones given.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organisation', type=int, nargs='+', dest='organisations',
+                            help='ids of the organisations to rebuild')
+
+    def handle(self, *args, **options):
+        organisations = Organisation.objects.order_by('id')
+        if options['organisations']:
+            organisations = organisations.filter(id__in=options['organisations'])
+        total = 0
+        for organisation in organisations.iterator():
+            count = refresh_compliance(organisation)
+            total += count
+            if options['verbosity'] > 1:
+                self.stdout.write('{}: {} statuses'.format(organisation, count))
+        self.stdout.write('Rebuilt {} compliance statuses.'.format(total))
@@ -0,0 +1,59 @@
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+# Each request is timed as a whole and split into the time spent waiting on the database,
+# rendering templates and everything else
+PARTS = ('total', 'db', 'template', 'python')
+
+BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+REQUEST_SECONDS = Histogram('flamingo_request_seconds', 'Time taken to handle flamingo requests, by part',
+                            ['view', 'part'], buckets=BUCKETS)
+REQUESTS = Counter('flamingo_requests_total', 'Flamingo requests handled', ['view', 'method'])
+ERRORS = Counter('flamingo_request_errors_total', 'Flamingo requests which ended in a server error', ['view'])
+
+
+def observe(url_name, method, status_code, total, db, template):
+    """
+    Record one flamingo request. Times are in seconds.
+    """
+    python = max(total - db - template, 0.0)
+    for part, seconds in zip(PARTS, (total, db, template, python)):
+        REQUEST_SECONDS.labels(url_name, part).observe(seconds)
+    REQUESTS.labels(url_name, method).inc()
+    if status_code >= 500:
+        ERRORS.labels(url_name).inc()
+
+
+def registry():
+    """
+    The registry to expose: when running under several worker processes (prometheus_multiproc_dir
+    is set) the samples every worker has written are merged, otherwise this process's own are used.
+    """
+    if 'prometheus_multiproc_dir' not in os.environ:
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+def metrics(request):
+    """
+    Expose the flamingo metrics in the Prometheus text format.
+
+    When settings.FLAMINGO_METRICS_TOKEN is set the scraper must send it as a bearer token;
+    without one, only logged in staff can see the metrics.
+    """
+    token = getattr(settings, 'FLAMINGO_METRICS_TOKEN', None)
+    if token:
+        allowed = request.META.get('HTTP_AUTHORIZATION') == 'Bearer {}'.format(token)
+    else:
+        user = getattr(request, 'user', None)
+        allowed = user is not None and user.is_active and user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(registry()), content_type=CONTENT_TYPE_LATEST)
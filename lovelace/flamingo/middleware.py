@@ -0,0 +1,104 @@
+import logging
+import time
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+from flamingo import metrics, profiling, tasks
+from flamingo.instrumentation import QueryRecorder, TemplateTimer
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_flamingo_url_name(request):
+    """
+    Resolve the request's url before the view runs and return its name if it is a flamingo
+    view, or None, so other requests can skip the instrumentation.
+    """
+    try:
+        match = resolve(request.path_info, getattr(request, 'urlconf', None))
+    except Resolver404:
+        return None
+    if 'flamingo' not in match.namespaces:
+        return None
+    return match.url_name
+
+
+class QueryBudgetMiddleware(object):
+    """
+    Record the query count, duplicate queries and database time of each flamingo view.
+
+    The figures are added to the response as X-Flamingo-* headers, and a warning is logged
+    when a view runs more queries than its entry in settings.FLAMINGO_QUERY_BUDGETS.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        url_name = resolve_flamingo_url_name(request)
+        if url_name is None:
+            return self.get_response(request)
+
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        duplicates = recorder.duplicates()
+        response['X-Flamingo-View'] = url_name
+        response['X-Flamingo-Query-Count'] = str(recorder.count)
+        response['X-Flamingo-Duplicate-Queries'] = ', '.join(
+            '{}*{}'.format(key, count) for key, (sql, count) in duplicates.items())
+        response['X-Flamingo-DB-Time'] = '{:.2f}'.format(recorder.db_time * 1000)
+
+        budget = getattr(settings, 'FLAMINGO_QUERY_BUDGETS', {}).get(url_name)
+        if budget is not None and recorder.count > budget:
+            logger.warning('flamingo:%s ran %d queries (budget %d); repeated: %s',
+                           url_name, recorder.count, budget,
+                           '; '.join('{} x{}'.format(sql, count) for sql, count in duplicates.values()))
+        return response
+
+
+class MetricsMiddleware(object):
+    """
+    Time each flamingo view for the Prometheus metrics, split into database, template and Python time.
+
+    Template time is only measured when TEMPLATES uses flamingo.instrumentation.TimedDjangoTemplates.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        url_name = resolve_flamingo_url_name(request)
+        if url_name is None or url_name == 'metrics':
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with QueryRecorder() as recorder, TemplateTimer(recorder) as timer:
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        metrics.observe(url_name, request.method, response.status_code, total, recorder.db_time, timer.elapsed)
+        return response
+
+
+class SlowRequestMiddleware(object):
+    """
+    Keep the SQL, query plans and (for a sample of requests) the profile of flamingo views
+    which take longer than settings.FLAMINGO_SLOW_REQUEST_SECONDS, for the slow requests page.
+
+    The plans are taken and the entry stored by a task, after the response has been returned.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        url_name = resolve_flamingo_url_name(request)
+        if url_name is None or url_name == 'slow-requests':
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with QueryRecorder() as recorder, profiling.Profiler(profiling.should_profile()) as profiler:
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        if duration >= profiling.threshold():
+            tasks.record_slow_request.delay(profiling.slow_request(
+                request, url_name, response.status_code, duration, recorder, profiler.profile))
+        return response
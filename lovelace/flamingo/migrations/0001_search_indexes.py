@@ -0,0 +1,51 @@
+from django.db import migrations
+
+# Columns searched by the flamingo list views. Django's icontains lookup compiles to
+# UPPER("column"::text) LIKE UPPER('%term%'), so the trigram index is built on that expression.
+# Table and column names are spelled out so the migration does not depend on how far the
+# other apps' migrations have got.
+SEARCH_COLUMNS = [
+    ('accounts_user', ['first_name', 'last_name', 'email']),
+    ('organisations_organisation', ['name']),
+    ('courses_course', ['title']),
+    ('courses_provider', ['name']),
+]
+
+
+def index_names():
+    for table, columns in SEARCH_COLUMNS:
+        for column in columns:
+            yield 'flamingo_{}_{}_trgm'.format(table, column)[:63], table, column
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    quote_name = schema_editor.quote_name
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in index_names():
+        schema_editor.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} USING gin (UPPER({}::text) gin_trgm_ops)'
+            .format(quote_name(name), quote_name(table), quote_name(column)))
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in index_names():
+        schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(schema_editor.quote_name(name)))
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently so large tables stay writable, which cannot run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('courses', '0001_initial'),
+        ('organisations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes, atomic=False),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organisations', '0001_initial'),
+        ('flamingo', '0001_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplianceStatus',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('compliant', models.BooleanField(default=False)),
+                ('valid_until', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                             related_name='compliance_statuses', to='organisations.Member')),
+                ('organisation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+',
+                                                   to='organisations.Organisation')),
+                ('requirement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                                  related_name='compliance_statuses',
+                                                  to='organisations.RoleRequirements')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='compliancestatus',
+            unique_together=set([('member', 'requirement')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='compliancestatus',
+            index_together=set([('organisation', 'member')]),
+        ),
+    ]
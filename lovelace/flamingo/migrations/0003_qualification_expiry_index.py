@@ -0,0 +1,32 @@
+from django.db import migrations
+
+INDEX_NAME = 'flamingo_qualification_expiry'
+TABLE = 'courses_qualification'
+COLUMNS = ['verification_status', 'expiry_date']
+
+
+def create_expiry_index(apps, schema_editor):
+    quote_name = schema_editor.quote_name
+    columns = ', '.join(quote_name(column) for column in COLUMNS)
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute('CREATE INDEX {}IF NOT EXISTS {} ON {} ({})'.format(
+        concurrently, quote_name(INDEX_NAME), quote_name(TABLE), columns))
+
+
+def drop_expiry_index(apps, schema_editor):
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute('DROP INDEX {}IF EXISTS {}'.format(concurrently, schema_editor.quote_name(INDEX_NAME)))
+
+
+class Migration(migrations.Migration):
+    # The expiry scanner reads verified qualifications by expiry_date range, see flamingo.expiry
+    atomic = False
+
+    dependencies = [
+        ('courses', '0001_initial'),
+        ('flamingo', '0002_compliancestatus'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_expiry_index, drop_expiry_index, atomic=False),
+    ]
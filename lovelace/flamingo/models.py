@@ -0,0 +1,26 @@
+from django.db import models
+
+from organisations.models import Member, Organisation, RoleRequirements
+
+
+class ComplianceStatus(models.Model):
+    """
+    Denormalised record of whether a member meets a requirement which applies to one of their roles.
+
+    Rows are kept up to date by flamingo.signals and can be rebuilt with the
+    rebuild_compliance management command. A row only counts as compliant until valid_until,
+    when the qualification meeting it expires (null if it never does).
+    """
+    organisation = models.ForeignKey(Organisation, on_delete=models.CASCADE, related_name='+')
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='compliance_statuses')
+    requirement = models.ForeignKey(RoleRequirements, on_delete=models.CASCADE, related_name='compliance_statuses')
+    compliant = models.BooleanField(default=False)
+    valid_until = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('member', 'requirement')]
+        index_together = [('organisation', 'member')]
+
+    def __str__(self):
+        return '{} / {}'.format(self.member_id, self.requirement_id)
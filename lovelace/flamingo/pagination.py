@@ -0,0 +1,198 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+def encode_cursor(direction, values):
+    data = json.dumps([direction, values], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, ordering):
+    """
+    Return the direction and ordering values held in a cursor, or None if it is not valid.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(data.decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    if direction not in ('next', 'previous') or not isinstance(values, list) or len(values) != len(ordering):
+        return None
+    return direction, values
+
+
+def keyset_field(model, path):
+    """
+    Return the model field an ordering path ends at, or None if it cannot be part of a keyset:
+    the rows are compared with lookups such as field__gt, which cannot match a NULL, so every
+    field on the way must be non-nullable, and the path must end at a column.
+    """
+    field = None
+    for name in path.split('__'):
+        if field is not None:
+            model = field.related_model
+        try:
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.null:
+            return None
+    return None if field.is_relation else field
+
+
+def keyset_ordering(queryset):
+    """
+    Return the queryset ordering as (field, descending) pairs ending in a unique key, or None
+    if the ordering cannot be used as a keyset (random or expression ordering, or ordering on
+    a nullable field).
+    """
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    keys = []
+    for field in ordering:
+        if not isinstance(field, str) or field == '?':
+            return None
+        path = field.lstrip('-')
+        if keyset_field(queryset.model, path) is None:
+            return None
+        keys.append((path, field.startswith('-')))
+    if not any(field in ('pk', 'id') for field, descending in keys):
+        keys.append(('pk', False))
+    return keys
+
+
+def ordering_values(obj, ordering):
+    values = []
+    for field, descending in ordering:
+        value = obj
+        for name in field.split('__'):
+            value = getattr(value, name)
+        values.append(value)
+    return values
+
+
+def keyset_filter(ordering, values, backwards):
+    """
+    Rows which come after the given ordering values, or before them when going backwards.
+    """
+    conditions = []
+    for i, (field, descending) in enumerate(ordering):
+        lookup = 'lt' if descending != backwards else 'gt'
+        condition = {previous: value for (previous, _), value in zip(ordering[:i], values)}
+        condition['{}__{}'.format(field, lookup)] = values[i]
+        conditions.append(Q(**condition))
+    return reduce(or_, conditions)
+
+
+class KeysetPaginator(object):
+    """
+    Paginator which seeks to a page using the ordering values of a neighbouring row, so any
+    page costs the same as the first. It has the attributes of Django's Paginator used by
+    the flamingo templates except count: the total would cost a COUNT(*) over the whole
+    result on every page, so pages only tell whether there is another one.
+    """
+    page_range = ()
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+
+    def page(self, cursor):
+        decoded = decode_cursor(cursor, self.ordering) if cursor else None
+        direction, values = decoded or ('next', None)
+        backwards = direction == 'previous'
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(keyset_filter(self.ordering, values, backwards))
+        queryset = queryset.order_by(*[
+            ('-' if descending != backwards else '') + field for field, descending in self.ordering])
+
+        # Fetch one extra row to find out whether there is another page in this direction
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = True, more
+        else:
+            has_next, has_previous = more, values is not None
+        return KeysetPage(rows, self, has_next, has_previous)
+
+
+class KeysetPage(object):
+    """
+    A page of rows from a KeysetPaginator. The "page numbers" are the cursors of the
+    neighbouring pages, so {% page_url page_obj.next_page_number %} links keep working.
+    """
+    number = None
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next and bool(object_list)
+        self._has_previous = has_previous and bool(object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_page_number(self):
+        return encode_cursor('next', ordering_values(self.object_list[-1], self.paginator.ordering))
+
+    def previous_page_number(self):
+        return encode_cursor('previous', ordering_values(self.object_list[0], self.paginator.ordering))
+
+
+def paginate(queryset, per_page, page):
+    """
+    Return the paginator and page of a queryset: by cursor when its ordering can be used as a
+    keyset, otherwise by offset, falling back to the first or last page like the other views.
+    """
+    ordering = keyset_ordering(queryset)
+    if ordering is not None:
+        paginator = KeysetPaginator(queryset, per_page, ordering)
+        return paginator, paginator.page(page)
+    paginator = Paginator(queryset, per_page)
+    try:
+        return paginator, paginator.page(page or 1)
+    except PageNotAnInteger:
+        return paginator, paginator.page(1)
+    except EmptyPage:
+        return paginator, paginator.page(paginator.num_pages)
+
+
+class KeysetPaginationMixin(object):
+    """
+    Paginate a ListView by cursor instead of by offset, so deep pages cost the same as the
+    first. Querysets whose ordering cannot be used as a keyset are paginated by offset.
+    """
+    def paginate_queryset(self, queryset, page_size):
+        ordering = keyset_ordering(queryset)
+        if ordering is None:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, page_size, ordering)
+        page = paginator.page(self.request.GET.get(self.page_kwarg))
+        return paginator, page, page.object_list, page.has_other_pages()
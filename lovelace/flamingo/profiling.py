@@ -0,0 +1,126 @@
+import cProfile
+import io
+import pstats
+import random
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+SLOW_REQUESTS_KEY = 'flamingo:slow-requests'
+
+# Only statements which read can be explained without side effects
+EXPLAINABLE = ('SELECT', 'WITH')
+
+
+def threshold():
+    return getattr(settings, 'FLAMINGO_SLOW_REQUEST_SECONDS', 1.0)
+
+
+def should_profile():
+    """
+    Whether to run this request under cProfile, for the sampled fraction of flamingo requests.
+    """
+    return random.random() < getattr(settings, 'FLAMINGO_PROFILE_SAMPLE_RATE', 0.1)
+
+
+def explain(query):
+    """
+    Return the query plan of a recorded statement, as text.
+    """
+    sql = query['sql']
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    try:
+        with connections[query['alias']].cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+    except DatabaseError as exc:
+        return 'EXPLAIN failed: {}'.format(exc)
+
+
+def profile_stats(profile, limit=40):
+    """
+    Format the functions of a profile which took the longest, including their callees.
+    """
+    output = io.StringIO()
+    pstats.Stats(profile, stream=output).sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
+
+
+def slow_request(request, url_name, status_code, duration, recorder, profile=None):
+    """
+    Build the record of a slow request: its SQL with timings and, when the request was
+    sampled, its profile. The query plans are added later by add_query_plans(), so the
+    request does not wait for them.
+    """
+    queries = sorted(recorder.queries, key=lambda query: float(query['time']), reverse=True)
+    timestamp = time.time()
+    return {
+        'id': '{:.6f}'.format(timestamp),
+        'timestamp': timestamp,
+        'view': url_name,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status_code': status_code,
+        'duration': duration,
+        'db_time': recorder.db_time,
+        'queries': [{'sql': query['sql'], 'time': float(query['time']), 'alias': query['alias'], 'plan': None}
+                    for query in queries],
+        'profile': profile_stats(profile) if profile is not None else None,
+    }
+
+
+def add_query_plans(entry):
+    """
+    Explain the slowest statements of a slow request, as many as FLAMINGO_SLOW_REQUEST_EXPLAIN.
+    """
+    explained = getattr(settings, 'FLAMINGO_SLOW_REQUEST_EXPLAIN', 3)
+    for query in entry['queries'][:explained]:
+        query['plan'] = explain(query)
+    return entry
+
+
+def record_slow_request(entry):
+    """
+    Add a slow request to the ring buffer kept in the cache, dropping the oldest once it is full.
+
+    The buffer is only shared by every worker when the default cache is a shared backend
+    (Redis, Memcached, the database); with the local memory cache each process keeps its own.
+    When two workers record at the same moment one of the entries can be lost.
+    """
+    entry['time'] = datetime.fromtimestamp(entry['timestamp'], timezone.utc)
+    size = getattr(settings, 'FLAMINGO_SLOW_REQUEST_BUFFER', 50)
+    entries = [entry] + (cache.get(SLOW_REQUESTS_KEY) or [])
+    cache.set(SLOW_REQUESTS_KEY, entries[:size], None)
+
+
+def slow_requests():
+    """
+    The recorded slow requests, newest first.
+    """
+    return cache.get(SLOW_REQUESTS_KEY) or []
+
+
+def clear_slow_requests():
+    cache.delete(SLOW_REQUESTS_KEY)
+
+
+class Profiler(object):
+    """
+    Run cProfile over the code in the context, when enabled.
+    """
+    def __init__(self, enabled=True):
+        self.profile = cProfile.Profile() if enabled else None
+
+    def __enter__(self):
+        if self.profile is not None:
+            self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.profile is not None:
+            self.profile.disable()
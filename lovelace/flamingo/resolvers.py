@@ -0,0 +1,19 @@
+from django.shortcuts import get_object_or_404
+
+from organisations.models import Organisation
+
+
+def get_organisation(request, pk):
+    """
+    Return the organisation with the given id, raising Http404 if there is none.
+
+    The organisation is loaded once per request, with its industry, and kept on the request
+    so the views, mixins, forms and templates handling it all share the same object.
+    """
+    organisations = getattr(request, '_flamingo_organisations', None)
+    if organisations is None:
+        organisations = request._flamingo_organisations = {}
+    key = str(pk)
+    if key not in organisations:
+        organisations[key] = get_object_or_404(Organisation.objects.select_related('industry'), pk=pk)
+    return organisations[key]
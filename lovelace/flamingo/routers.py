@@ -0,0 +1,140 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Requests within this many seconds of a write by the same client read from the primary,
+# so the redirect after a POST shows what was just saved. Pages whose data changed this
+# recently read from the primary too, see read_primary_if_changed().
+PIN_SECONDS = 10
+PIN_COOKIE = 'flamingo_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = threading.local()
+
+
+def replica_alias():
+    """
+    Return the database alias flamingo reads from, or None if no replica is configured.
+    """
+    alias = getattr(settings, 'FLAMINGO_REPLICA_DATABASE', 'replica')
+    if alias and alias in settings.DATABASES and alias != DEFAULT_DB_ALIAS:
+        return alias
+    return None
+
+
+def pin_seconds():
+    return getattr(settings, 'FLAMINGO_REPLICA_PIN_SECONDS', PIN_SECONDS)
+
+
+def read_alias(request):
+    """
+    Return the alias the request should read from: the replica for safe requests from clients
+    which have not written recently, otherwise the primary.
+    """
+    if request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES:
+        return replica_alias()
+    return None
+
+
+@contextmanager
+def reading_from(alias):
+    previous = getattr(_state, 'alias', None)
+    _state.alias = alias
+    try:
+        yield
+    finally:
+        _state.alias = previous
+
+
+def reading_each(alias, iterable):
+    """
+    Iterate with reads sent to alias while each item is produced, for content streamed after
+    the view has returned.
+    """
+    iterator = iter(iterable)
+    while True:
+        with reading_from(alias):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def read_primary_if_changed(versions):
+    """
+    Send the rest of the current request's reads to the primary if any of the versions (see
+    flamingo.caching) changed within the pin window. What the request reads is cached or
+    validated under those versions, and the replica may not have the change yet.
+    """
+    if getattr(_state, 'alias', None) is None:
+        return
+    # Versions are millisecond timestamps of the last change
+    since = (time.time() - pin_seconds()) * 1000
+    if any(version > since for version in versions):
+        _state.alias = None
+
+
+def route_request(view, request, *args, **kwargs):
+    alias = read_alias(request)
+    with reading_from(alias):
+        response = view(request, *args, **kwargs)
+        # Templates run queries too, so render class-based views' responses here
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+    if getattr(response, 'streaming', False):
+        response.streaming_content = reading_each(alias, response.streaming_content)
+    if request.method not in SAFE_METHODS:
+        response.set_cookie(PIN_COOKIE, '1', max_age=pin_seconds(), httponly=True)
+    return response
+
+
+class ReplicaRoutingMixin(object):
+    """
+    Send the reads of GET requests to the replica database, and pin writes and the requests
+    shortly after them to the primary. See FlamingoReplicaRouter.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        return route_request(super().dispatch, request, *args, **kwargs)
+
+
+def replica_routing(view):
+    """
+    Function view version of ReplicaRoutingMixin.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        return route_request(view, request, *args, **kwargs)
+    return wrapped
+
+
+class FlamingoReplicaRouter(object):
+    """
+    Database router which sends reads made while a flamingo view handles a GET request to
+    settings.FLAMINGO_REPLICA_DATABASE ("replica" by default). Everything else, and every
+    read when that alias is not configured, uses the default database.
+
+    Add it to DATABASE_ROUTERS. To try it locally, add a second alias with the same
+    settings as "default", and TEST = {'MIRROR': 'default'} so tests share its data.
+    """
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'alias', None)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db == replica_alias():
+            return False
+        return None
@@ -0,0 +1,57 @@
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Greatest
+from django.utils.module_loading import import_string
+
+
+class ContainsSearchBackend(object):
+    """
+    Match rows where any of the fields contain the search term, ignoring case.
+    """
+    def filter(self, queryset, query, fields):
+        return queryset.filter(reduce(or_, (Q(**{field + '__icontains': query}) for field in fields)))
+
+    def rank(self, queryset, query, fields):
+        return queryset
+
+    def search(self, queryset, query, fields):
+        return self.rank(self.filter(queryset, query, fields), query, fields)
+
+
+class TrigramSearchBackend(ContainsSearchBackend):
+    """
+    PostgreSQL search which orders matches by trigram similarity, best first.
+
+    Matching is unchanged from ContainsSearchBackend. The UPPER(...) LIKE statements it
+    produces are served by the pg_trgm GIN indexes created in the flamingo migrations, and
+    similarity is only computed for the rows that match.
+    """
+    def rank(self, queryset, query, fields):
+        ordering = queryset.query.order_by
+        similarities = [TrigramSimilarity(field, query) for field in fields]
+        rank = Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+        return queryset.annotate(search_rank=rank).order_by('-search_rank', *ordering)
+
+
+def get_search_backend(using):
+    """
+    Return the backend named by settings.FLAMINGO_SEARCH_BACKEND, or the best one for the database.
+    """
+    path = getattr(settings, 'FLAMINGO_SEARCH_BACKEND', None)
+    if path is not None:
+        return import_string(path)()
+    if connections[using].vendor == 'postgresql':
+        return TrigramSearchBackend()
+    return ContainsSearchBackend()
+
+
+def search(queryset, query, fields):
+    """
+    Filter a queryset to rows where any of the fields contain the query.
+    """
+    return get_search_backend(queryset.db).search(queryset, query, fields)
@@ -0,0 +1,116 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.models import User
+from courses.models import Course, Qualification
+from flamingo import tasks
+from flamingo.caching import bump_user_version, invalidate_course_choices
+from organisations.models import Member, Role, RoleRequirements
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, **kwargs):
+    invalidate_course_choices()
+
+
+# Organisation id to the member ids to refresh (None for every member), per thread, until
+# the transaction which asked for them commits
+_pending_refreshes = threading.local()
+
+
+def queue_compliance_refreshes():
+    pending = getattr(_pending_refreshes, 'organisations', {})
+    _pending_refreshes.organisations = {}
+    for org_id, member_ids in pending.items():
+        tasks.refresh_compliance.delay(org_id, sorted(member_ids) if member_ids is not None else None)
+
+
+def schedule_compliance_refresh(org_id, member_ids=None):
+    """
+    Refresh the compliance snapshot once the current transaction commits, so the task sees
+    the change and nothing is queued for a rolled back one.
+
+    The refreshes asked for during a transaction are merged, so one edit which sends several
+    signals queues a single task per organisation.
+    """
+    pending = getattr(_pending_refreshes, 'organisations', None)
+    if pending is None:
+        pending = _pending_refreshes.organisations = {}
+    if org_id not in pending or pending[org_id] is not None:
+        pending[org_id] = None if member_ids is None else pending.get(org_id, set()) | set(member_ids)
+    # After a rollback the merged refreshes are queued by the next transaction which asks
+    # for one; refreshing again is harmless
+    connection = transaction.get_connection()
+    if not any(hook[1] is queue_compliance_refreshes for hook in connection.run_on_commit):
+        transaction.on_commit(queue_compliance_refreshes)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_user_version(instance.id)
+
+
+@receiver(m2m_changed, sender=Qualification.organisations.through)
+def qualification_visibility_changed(sender, instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Qualification):
+        bump_user_version(instance.user_id)
+
+
+@receiver(post_save, sender=Qualification)
+@receiver(post_delete, sender=Qualification)
+def qualification_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_user_version(instance.user_id)
+    memberships = Member.objects.filter(user_id=instance.user_id).values_list('organisation_id', 'id')
+    member_ids = {}
+    for org_id, member_id in memberships:
+        member_ids.setdefault(org_id, []).append(member_id)
+    for org_id, ids in member_ids.items():
+        schedule_compliance_refresh(org_id, ids)
+
+
+@receiver(m2m_changed, sender=Member.roles.through)
+def member_roles_changed(sender, instance, action, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, Member):
+        schedule_compliance_refresh(instance.organisation_id, [instance.id])
+    else:
+        # role.members was changed, which can touch any member of the organisation
+        schedule_compliance_refresh(instance.organisation_id)
+
+
+@receiver(m2m_changed, sender=RoleRequirements.roles.through)
+@receiver(m2m_changed, sender=RoleRequirements.courses.through)
+def requirement_links_changed(sender, instance, action, pk_set, **kwargs):
+    if isinstance(instance, RoleRequirements):
+        if action.startswith('post_'):
+            schedule_compliance_refresh(instance.organisation_id)
+        return
+    # Changed from the role or course side, so refresh each organisation with an affected
+    # requirement. A clear has no pk_set, so note the requirements before they are unlinked.
+    if action == 'pre_clear':
+        link = {'{}_id'.format(instance._meta.model_name): instance.pk}
+        instance._cleared_requirements = set(sender.objects.filter(**link)
+                                             .values_list('rolerequirements_id', flat=True))
+        return
+    if not action.startswith('post_'):
+        return
+    requirement_ids = pk_set if pk_set is not None else getattr(instance, '_cleared_requirements', set())
+    for org_id in set(RoleRequirements.objects.filter(pk__in=requirement_ids)
+                      .values_list('organisation_id', flat=True)):
+        schedule_compliance_refresh(org_id)
+
+
+@receiver(post_save, sender=RoleRequirements)
+@receiver(post_delete, sender=Role)
+def organisation_requirements_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_compliance_refresh(instance.organisation_id)
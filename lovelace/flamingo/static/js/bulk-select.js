@@ -0,0 +1,52 @@
+/**
+ * Ticks rows of a table for a bulk action.
+ *
+ * Checkboxes name the form they belong to with the form attribute, so they can
+ * sit in a table outside it. A checkbox with data-select-all="<form id>" ticks
+ * or clears every checkbox of that form. The form's submit button is enabled
+ * once something is ticked, and asks for confirmation with the message in the
+ * form's data-confirm, where {count} is replaced by the number ticked.
+ */
+(function() {
+  function boxes(form) {
+    return document.querySelectorAll('input[type=checkbox][form="' + form.id + '"]');
+  }
+
+  function ticked(form) {
+    return Array.prototype.filter.call(boxes(form), function(box) {
+      return box.checked;
+    }).length;
+  }
+
+  function update(form) {
+    form.querySelector('[type=submit]').disabled = ticked(form) === 0;
+  }
+
+  function attach(form) {
+    Array.prototype.forEach.call(boxes(form), function(box) {
+      box.addEventListener('change', function() {
+        update(form);
+      });
+    });
+    var all = document.querySelector('input[data-select-all="' + form.id + '"]');
+    if (all) {
+      all.addEventListener('change', function() {
+        Array.prototype.forEach.call(boxes(form), function(box) {
+          box.checked = all.checked;
+        });
+        update(form);
+      });
+    }
+    form.addEventListener('submit', function(event) {
+      var message = form.getAttribute('data-confirm').replace('{count}', ticked(form));
+      if (!window.confirm(message)) {
+        event.preventDefault();
+      }
+    });
+    update(form);
+  }
+
+  document.addEventListener('DOMContentLoaded', function() {
+    Array.prototype.forEach.call(document.querySelectorAll('form[data-bulk]'), attach);
+  });
+})();
@@ -0,0 +1,60 @@
+/**
+ * Suggests matches in a search box as the user types.
+ *
+ * Inputs with a data-typeahead attribute are given a datalist filled from the
+ * JSON endpoint it names, which returns [{id, label}, ...] for ?q=<term>.
+ * Requests wait for a short pause in typing, and a response is ignored if the
+ * term has changed since it was sent. If the input also has a data-typeahead-detail
+ * URL for object 0, choosing a suggestion opens that object's page instead.
+ */
+(function() {
+  var DELAY = 150;
+
+  function attach(input) {
+    var list = document.createElement('datalist');
+    var timer = null;
+    var suggested = [];
+    list.id = input.id + 'Suggestions';
+    input.parentNode.insertBefore(list, input.nextSibling);
+    input.setAttribute('list', list.id);
+    input.setAttribute('autocomplete', 'off');
+
+    function fill(suggestions) {
+      suggested = suggestions;
+      while (list.firstChild) {
+        list.removeChild(list.firstChild);
+      }
+      suggestions.forEach(function(suggestion) {
+        var option = document.createElement('option');
+        option.value = suggestion.label;
+        list.appendChild(option);
+      });
+    }
+
+    input.addEventListener('input', function() {
+      var term = input.value.trim();
+      var detail = input.dataset.typeaheadDetail;
+      var chosen = suggested.filter(function(suggestion) { return suggestion.label === input.value; });
+      if (detail && chosen.length) {
+        window.location = detail.replace('/0/', '/' + chosen[0].id + '/');
+        return;
+      }
+      clearTimeout(timer);
+      if (!term) {
+        fill([]);
+        return;
+      }
+      timer = setTimeout(function() {
+        fetch(input.dataset.typeahead + '?q=' + encodeURIComponent(term), {credentials: 'same-origin'})
+          .then(function(response) { return response.json(); })
+          .then(function(suggestions) {
+            if (input.value.trim() === term) {
+              fill(suggestions);
+            }
+          });
+      }, DELAY);
+    });
+  }
+
+  document.querySelectorAll('input[data-typeahead]').forEach(attach);
+})();
@@ -0,0 +1,101 @@
+import gzip
+import io
+import os
+
+import brotli
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from PIL import Image
+
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+IMAGE_EXTENSIONS = ('.png',)
+# Images larger than this are scaled down to fit, keeping their aspect ratio
+IMAGE_MAX_SIZE = (1024, 1024)
+# A compressed variant is only written when it saves at least this fraction of the file
+MIN_SAVING = 0.05
+
+
+class FlamingoStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Static files storage which fingerprints files and prepares them to be served with
+    far-future cache headers.
+
+    On top of ManifestStaticFilesStorage, which writes content-hashed copies that
+    {% static %} resolves to, collectstatic also:
+
+    - recompresses each PNG with Pillow before it is hashed, first scaling it down to
+      settings.FLAMINGO_STATIC_IMAGE_SIZES[name] (or IMAGE_MAX_SIZE) if it is larger;
+    - writes .gz and .br variants of hashed text assets next to them, for the web server
+      to send to clients which accept them.
+
+    Enable it with STATICFILES_STORAGE = 'flamingo.storage.FlamingoStaticFilesStorage'.
+    """
+    def url_converter(self, name, *args, **kwargs):
+        converter = super().url_converter(name, *args, **kwargs)
+
+        def convert(matchobj):
+            # Leave references to files which do not exist as they are, rather than failing
+            # the whole build over a missing image in vendored CSS
+            try:
+                return converter(matchobj)
+            except ValueError:
+                return matchobj.group(0)
+        return convert
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            # The images are optimised first, so their hashed names fingerprint the bytes served
+            paths = dict(paths)
+            for name, (storage, path) in list(paths.items()):
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS and self.optimise_image(name, storage, path):
+                    paths[name] = (self, name)
+        hashed_files = {}
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_files[name] = hashed_name
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name, hashed_name in hashed_files.items():
+            if os.path.splitext(name)[1].lower() in COMPRESSED_EXTENSIONS:
+                self.compress(hashed_name)
+
+    def replace(self, name, content):
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(content))
+
+    def optimise_image(self, name, storage, path):
+        """
+        Replace the collected copy of an image with an optimised one, and return whether it was.
+        """
+        with storage.open(path) as image_file:
+            original = image_file.read()
+        image = Image.open(io.BytesIO(original))
+        max_size = getattr(settings, 'FLAMINGO_STATIC_IMAGE_SIZES', {}).get(name, IMAGE_MAX_SIZE)
+        resized = image.width > max_size[0] or image.height > max_size[1]
+        if resized:
+            image.thumbnail(max_size, Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format='PNG', optimize=True)
+        if resized or len(output.getvalue()) < len(original):
+            self.replace(name, output.getvalue())
+            return True
+        return False
+
+    def compress(self, hashed_name):
+        with self.open(hashed_name) as asset:
+            content = asset.read()
+        variants = [('.gz', self.gzip(content)), ('.br', brotli.compress(content, quality=11))]
+        for suffix, compressed in variants:
+            if len(compressed) <= len(content) * (1 - MIN_SAVING):
+                self.replace(hashed_name + suffix, compressed)
+
+    @staticmethod
+    def gzip(content):
+        output = io.BytesIO()
+        # A fixed mtime keeps the output, and so the deployed files, the same between builds
+        with gzip.GzipFile(fileobj=output, mode='wb', compresslevel=9, mtime=0) as gzip_file:
+            gzip_file.write(content)
+        return output.getvalue()
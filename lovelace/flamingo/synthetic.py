@@ -0,0 +1,276 @@
+import random
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import transaction
+
+from accounts.models import User
+from courses.models import Course, Curriculum, Provider, Qualification
+from flamingo.compliance import refresh_compliance
+from flamingo.exports import chunked
+from organisations.models import Industry, Member, Organisation, Role, RoleRequirements
+
+BATCH_SIZE = 5000
+
+FIRST_NAMES = ['Olivia', 'Jack', 'Charlotte', 'William', 'Mia', 'Oliver', 'Amelia', 'Noah', 'Isla', 'Thomas',
+               'Ava', 'James', 'Grace', 'Lucas', 'Chloe', 'Henry', 'Sophie', 'Ethan', 'Ruby', 'Liam']
+LAST_NAMES = ['Smith', 'Jones', 'Williams', 'Brown', 'Wilson', 'Taylor', 'Nguyen', 'Johnson', 'Martin', 'White',
+              'Anderson', 'Walker', 'Thompson', 'Harris', 'Lee', 'Ryan', 'Robinson', 'Kelly', 'King', 'Davis']
+PLACES = ['Southern Peninsula', 'Bayside', 'Frankston', 'Geelong', 'Ballarat', 'Bendigo', 'Yarra Valley',
+          'Dandenong', 'Werribee', 'Mornington', 'Box Hill', 'Essendon', 'Caulfield', 'Ringwood', 'Sunbury']
+ACTIVITIES = ['Basketball', 'Netball', 'Football', 'Water Polo', 'Swimming', 'Cricket', 'Athletics', 'Hockey',
+              'Childcare', 'Scouts', 'Tennis', 'Gymnastics']
+KINDS = ['Association', 'Club', 'League', 'Centre', 'Academy']
+STREETS = ['High Street', 'Station Street', 'Main Road', 'Church Street', 'Beach Road', 'Park Avenue']
+ROLE_NAMES = ['Coach', 'Assistant Coach', 'Manager', 'Referee', 'Volunteer', 'Trainer', 'First Aider',
+              'Committee Member', 'Team Leader', 'Umpire']
+COURSE_TOPICS = ['Working With Children Check', 'First Aid', 'CPR', 'Anaphylaxis Management', 'Asthma Management',
+                 'Coaching', 'Officiating', 'Food Safety', 'Child Safety', 'Concussion Awareness', 'Bronze Medallion',
+                 'Mental Health First Aid']
+PROVIDER_KINDS = ['Training', 'Institute', 'Academy', 'Services', 'Association']
+
+# Share of documents which have been revoked; the rest are verified, or expired once past their expiry date
+REVOKED_RATE = 0.02
+
+
+def identifier():
+    return str(uuid.uuid4())
+
+
+class DatasetGenerator(object):
+    """
+    Fill the database with a synthetic dataset of a given size, for benchmarking.
+
+    Everything is written with bulk inserts, in batches, and read back by identifier since not
+    every database returns primary keys from a bulk insert. Each batch commits on its own, so a
+    large dataset never holds one long transaction open. Members are spread at random over
+    the users, so users belong to several organisations and many to none, and each user's
+    qualifications are visible to the organisations they belong to.
+    """
+    def __init__(self, organisations=10, users=1000, members=50, roles=5, requirements=5, courses=20,
+                 providers=10, qualifications=None, seed=None, batch_size=BATCH_SIZE, today=None, log=None):
+        self.counts = {
+            'organisations': organisations,
+            'users': users,
+            'members': min(members, users),
+            'roles': roles,
+            'requirements': min(requirements, courses),
+            'courses': courses,
+            'providers': providers,
+            'qualifications': users * 10 if qualifications is None else qualifications,
+        }
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.today = today or date.today()
+        self.log = log or (lambda message: None)
+
+    def bulk_create(self, model, objects, key='identifier'):
+        """
+        Insert objects in batches and return a dict of each object's key to its new id.
+        """
+        ids = {}
+        for chunk in chunked(objects, self.batch_size):
+            model.objects.bulk_create(chunk)
+            keys = [getattr(obj, key) for obj in chunk]
+            ids.update((str(value), pk) for value, pk in
+                       model.objects.filter(**{key + '__in': keys}).values_list(key, 'id'))
+        return ids
+
+    def bulk_create_rows(self, model, rows):
+        """
+        Insert rows, given as dicts of field values, in batches without reading their ids back.
+        """
+        for chunk in chunked(rows, self.batch_size):
+            model.objects.bulk_create([model(**row) for row in chunk])
+
+    def name(self):
+        return self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+
+    def generate(self):
+        """
+        Write the whole dataset and return the number of rows created of each kind.
+        """
+        created = defaultdict(int)
+        course_ids = self.create_courses(created)
+        provider_ids = self.create_providers(course_ids, created)
+        organisation_ids = self.create_organisations(created)
+        user_ids = self.create_users(created)
+        role_ids = self.create_roles(organisation_ids, created)
+        self.create_requirements(role_ids, course_ids, created)
+        memberships = self.create_members(organisation_ids, user_ids, role_ids, created)
+        self.create_qualifications(user_ids, course_ids, provider_ids, memberships, created)
+        # The bulk inserts send no signals, so the compliance snapshot is built here
+        for organisation in Organisation.objects.filter(id__in=organisation_ids).iterator():
+            created['compliance statuses'] += refresh_compliance(organisation, today=self.today,
+                                                                 batch_size=self.batch_size)
+        return dict(created)
+
+    def create_courses(self, created):
+        courses = []
+        for n in range(self.counts['courses']):
+            topic = COURSE_TOPICS[n % len(COURSE_TOPICS)]
+            title = topic if n < len(COURSE_TOPICS) else '{} Level {}'.format(topic, n // len(COURSE_TOPICS) + 1)
+            courses.append(Course(identifier=identifier(), title=title))
+        course_ids = list(self.bulk_create(Course, courses).values())
+        created['courses'] = len(course_ids)
+        self.log('Created {} courses'.format(len(course_ids)))
+        return course_ids
+
+    def provider_names(self):
+        """
+        Yield provider names not in use yet, so the new providers can be read back by name.
+        """
+        taken = set(Provider.objects.values_list('name', flat=True))
+        n = 0
+        while True:
+            n += 1
+            name = '{} {} {}'.format(self.random.choice(PLACES), self.random.choice(ACTIVITIES),
+                                     self.random.choice(PROVIDER_KINDS))
+            if name in taken:
+                name = '{} {}'.format(name, n)
+            if name not in taken:
+                taken.add(name)
+                yield name
+
+    def create_providers(self, course_ids, created):
+        names = self.provider_names()
+        providers = (Provider(name=next(names)) for _ in range(self.counts['providers']))
+        provider_ids = list(self.bulk_create(Provider, providers, key='name').values())
+        # Each course is run by a couple of providers
+        curriculums = [{'course_id': course_id, 'provider_id': provider_id}
+                       for course_id in course_ids
+                       for provider_id in self.random.sample(provider_ids, min(2, len(provider_ids)))]
+        self.bulk_create_rows(Curriculum, curriculums)
+        created['providers'] = len(provider_ids)
+        created['curriculums'] = len(curriculums)
+        self.log('Created {} providers and {} curriculums'.format(len(provider_ids), len(curriculums)))
+        return provider_ids
+
+    def organisation(self, industry_ids):
+        name = '{} {} {}'.format(self.random.choice(PLACES), self.random.choice(ACTIVITIES), self.random.choice(KINDS))
+        address = '{} {}, {} VIC {}'.format(self.random.randint(1, 400), self.random.choice(STREETS),
+                                            self.random.choice(PLACES), self.random.randint(3000, 3999))
+        return Organisation(identifier=identifier(), industry_id=self.random.choice(industry_ids), name=name,
+                            address=address)
+
+    def create_organisations(self, created):
+        industry_ids = list(Industry.objects.values_list('id', flat=True))
+        if not industry_ids:
+            industry_ids = [Industry.objects.create(name='Sport').id]
+        organisations = (self.organisation(industry_ids) for _ in range(self.counts['organisations']))
+        organisation_ids = list(self.bulk_create(Organisation, organisations).values())
+        created['organisations'] = len(organisation_ids)
+        self.log('Created {} organisations'.format(len(organisation_ids)))
+        return organisation_ids
+
+    def create_users(self, created):
+        # A run-specific part keeps the email addresses unique across runs
+        domain = 'example-{}.com'.format(uuid.uuid4().hex[:8])
+
+        def users():
+            for n in range(self.counts['users']):
+                first_name, last_name = self.name()
+                yield User(identifier=identifier(), first_name=first_name, last_name=last_name,
+                           email='{}.{}.{}@{}'.format(first_name, last_name, n, domain).lower(),
+                           phone='04{:08d}'.format(self.random.randint(0, 99999999)))
+        user_ids = list(self.bulk_create(User, users()).values())
+        created['users'] = len(user_ids)
+        self.log('Created {} users'.format(len(user_ids)))
+        return user_ids
+
+    def create_roles(self, organisation_ids, created):
+        roles = (Role(identifier=identifier(), organisation_id=organisation_id, name=name)
+                 for organisation_id in organisation_ids
+                 for name in self.random.sample(ROLE_NAMES, min(self.counts['roles'], len(ROLE_NAMES))))
+        ids = self.bulk_create(Role, roles)
+        role_ids = defaultdict(list)
+        for role_id, organisation_id in Role.objects.filter(id__in=list(ids.values())).values_list(
+                'id', 'organisation_id'):
+            role_ids[organisation_id].append(role_id)
+        created['roles'] = len(ids)
+        self.log('Created {} roles'.format(len(ids)))
+        return role_ids
+
+    def create_requirements(self, role_ids, course_ids, created):
+        titles = dict(Course.objects.filter(id__in=course_ids).values_list('id', 'title'))
+        requirements = {}
+        for organisation_id, roles in role_ids.items():
+            for course_id in self.random.sample(course_ids, self.counts['requirements']):
+                # Some requirements accept an alternative document
+                alternatives = self.random.sample(course_ids, 1) if self.random.random() < 0.3 else []
+                requirement = RoleRequirements(identifier=identifier(), organisation_id=organisation_id,
+                                               name=titles[course_id])
+                requirements[requirement.identifier] = (
+                    requirement, self.random.sample(roles, min(2, len(roles))), set([course_id] + alternatives))
+        ids = self.bulk_create(RoleRequirements, (values[0] for values in requirements.values()))
+        self.bulk_create_rows(RoleRequirements.roles.through, (
+            {'rolerequirements_id': ids[key], 'role_id': role_id}
+            for key, (requirement, roles, courses) in requirements.items() for role_id in roles))
+        self.bulk_create_rows(RoleRequirements.courses.through, (
+            {'rolerequirements_id': ids[key], 'course_id': course_id}
+            for key, (requirement, roles, courses) in requirements.items() for course_id in courses))
+        created['requirements'] = len(ids)
+        self.log('Created {} requirements'.format(len(ids)))
+
+    def create_members(self, organisation_ids, user_ids, role_ids, created):
+        """
+        Add members to every organisation and return a dict of user id to their organisations.
+        """
+        members = {}
+        for organisation_id in organisation_ids:
+            for user_id in self.random.sample(user_ids, self.counts['members']):
+                member = Member(identifier=identifier(), organisation_id=organisation_id, user_id=user_id, level='')
+                # Most members have one role, some two and a few none
+                roles = self.random.sample(role_ids[organisation_id],
+                                           min(self.random.choice([0, 1, 1, 1, 2]), len(role_ids[organisation_id])))
+                members[member.identifier] = (member, roles)
+        ids = self.bulk_create(Member, (values[0] for values in members.values()))
+        self.bulk_create_rows(Member.roles.through, (
+            {'member_id': ids[key], 'role_id': role_id}
+            for key, (member, roles) in members.items() for role_id in roles))
+        memberships = defaultdict(list)
+        for member, roles in members.values():
+            memberships[member.user_id].append(member.organisation_id)
+        created['members'] = len(ids)
+        self.log('Created {} members'.format(len(ids)))
+        return memberships
+
+    def qualification(self, n, user_ids, course_ids, provider_ids, prefix):
+        attained_date = self.today - timedelta(days=self.random.randint(0, 5 * 365))
+        # A fifth of the documents never expire, the rest last one to three years
+        expiry_date = None
+        if self.random.random() >= 0.2:
+            expiry_date = attained_date + timedelta(days=365 * self.random.randint(1, 3))
+        if self.random.random() < REVOKED_RATE:
+            status = 'REVOKED'
+        elif expiry_date is not None and expiry_date < self.today:
+            status = 'EXPIRED'
+        else:
+            status = 'VERIFIED'
+        return Qualification(user_id=self.random.choice(user_ids), course_id=self.random.choice(course_ids),
+                             provider_id=self.random.choice(provider_ids), verification_status=status,
+                             attained_date=attained_date, expiry_date=expiry_date,
+                             document_number='{}-{:08d}'.format(prefix, n))
+
+    def create_qualifications(self, user_ids, course_ids, provider_ids, memberships, created):
+        # Document numbers are unique to this run, so the new rows can be read back by them
+        prefix = uuid.uuid4().hex[:8].upper()
+        through = Qualification.organisations.through
+        total = 0
+        numbers = range(self.counts['qualifications'])
+        for chunk in chunked(numbers, self.batch_size):
+            qualifications = [self.qualification(n, user_ids, course_ids, provider_ids, prefix) for n in chunk]
+            # A batch of documents is committed together with who they are visible to
+            with transaction.atomic():
+                Qualification.objects.bulk_create(qualifications)
+                # Each document is visible to the organisations its holder belongs to
+                through.objects.bulk_create([
+                    through(qualification_id=qualification_id, organisation_id=organisation_id)
+                    for qualification_id, user_id in Qualification.objects.filter(
+                        document_number__in=[qualification.document_number for qualification in qualifications])
+                    .values_list('id', 'user_id')
+                    for organisation_id in memberships.get(user_id, [])])
+            total += len(qualifications)
+            self.log('Created {} of {} qualifications'.format(total, self.counts['qualifications']))
+        created['qualifications'] = total
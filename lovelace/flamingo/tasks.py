@@ -0,0 +1,54 @@
+import codecs
+
+from celery import shared_task
+from django.core.files.storage import default_storage
+
+from flamingo import compliance, expiry, profiling
+from flamingo.imports import MemberImporter, get_progress, set_progress
+from organisations.models import Organisation
+
+
+@shared_task
+def import_members(org_id, path, import_id):
+    """
+    Import members into an organisation from a CSV saved in the default storage.
+    """
+    organisation = Organisation.objects.get(pk=org_id)
+    try:
+        with default_storage.open(path, 'rb') as csv_file:
+            MemberImporter(organisation, import_id).run(codecs.iterdecode(csv_file, 'utf-8-sig'))
+    except Exception:
+        progress = get_progress(import_id) or {}
+        progress['status'] = 'FAILED'
+        set_progress(import_id, progress)
+        raise
+    finally:
+        default_storage.delete(path)
+
+
+@shared_task
+def refresh_compliance(org_id, member_ids=None):
+    """
+    Recalculate the compliance snapshot of an organisation, or of some of its members.
+    """
+    organisation = Organisation.objects.filter(pk=org_id).first()
+    if organisation is None:
+        return
+    compliance.refresh_compliance(organisation, member_ids)
+
+
+@shared_task
+def check_qualification_expiry(days=None):
+    """
+    Expire lapsed qualifications and send the expiry digests. Meant to be run daily by celery beat.
+    """
+    return expiry.check_expiry(days=days)
+
+
+@shared_task
+def record_slow_request(entry):
+    """
+    Explain the slowest statements of a slow request and keep it for the slow requests page,
+    outside the request it was recorded in. See SlowRequestMiddleware.
+    """
+    profiling.record_slow_request(profiling.add_query_plans(entry))
@@ -0,0 +1,16 @@
+from django import template
+
+from flamingo.caching import organisation_version
+
+register = template.Library()
+
+
+@register.filter
+def fragment_version(organisation):
+    """
+    Vary a {% cache %} fragment on an organisation and the version of its data, e.g.
+    {% cache 3600 org_members organisation|fragment_version sort %}.
+    """
+    if not organisation:
+        return ''
+    return '{}.{}'.format(organisation.id, organisation_version(organisation.id))
@@ -0,0 +1,14 @@
+from django import template
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def page_url(context, page):
+    """
+    Link to another page of the current list, keeping the search and sort parameters, e.g.
+    <a href="{% page_url page_obj.next_page_number %}">.
+    """
+    query = context['request'].GET.copy()
+    query['page'] = page
+    return '?' + query.urlencode()
@@ -1,3 +1,857 @@
-# from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import html
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import date, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import brotli
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, router, transaction
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, modify_settings,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.views import View
+from prometheus_client import REGISTRY
+
+from accounts.models import User
+from courses.models import Course, Curriculum, Provider, Qualification
+from flamingo import tasks
+from flamingo.api import TYPEAHEAD_LIMIT, typeahead_cache
+from flamingo.benchmark import compare, run_benchmark
+from flamingo.caching import invalidate_course_choices, organisation_version, user_version, version_key
+from flamingo.compliance import compliance_members, evaluate_compliance, refresh_compliance, snapshot_matrix
+from flamingo.expiry import check_expiry
+from flamingo.exports import MEMBER_COLUMNS
+from flamingo.forms import AddRequirementForm
+from flamingo.middleware import resolve_flamingo_url_name
+from flamingo.models import ComplianceStatus
+from flamingo.pagination import keyset_ordering, paginate
+from flamingo.profiling import clear_slow_requests, slow_requests
+from flamingo.routers import PIN_COOKIE, ReplicaRoutingMixin
+from flamingo.search import ContainsSearchBackend, TrigramSearchBackend, get_search_backend, search
+from flamingo.storage import FlamingoStaticFilesStorage
+from notifications.models import Notification
+from organisations.models import Member, Organisation, Role, RoleRequirements
+
+
+class EagerTasksMixin(object):
+    """
+    Run the celery tasks the code under test queues in process, as the workers would.
+    """
+    def setUp(self):
+        super().setUp()
+        conf = tasks.refresh_compliance.app.conf
+        self.addCleanup(setattr, conf, 'task_always_eager', conf.task_always_eager)
+        conf.task_always_eager = True
+
+
+@modify_settings(MIDDLEWARE={'append': 'flamingo.middleware.QueryBudgetMiddleware'})
+class QueryBudgetTestCase(TestCase):
+    """
+    Base test case which can assert the number of queries a flamingo view runs.
+    """
+    fixtures = ['test_data.json']
+
+    def assertQueryBudget(self, url_name, budget, *args, data=None):
+        response = self.client.get(reverse('flamingo:' + url_name, args=args), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Flamingo-View'], url_name)
+        count = int(response['X-Flamingo-Query-Count'])
+        self.assertLessEqual(count, budget, 'flamingo:{} ran {} queries (budget {}), repeated: {}'.format(
+            url_name, count, budget, response['X-Flamingo-Duplicate-Queries'] or 'none'))
+        return response
+
+
+class ViewQueryBudgetTests(QueryBudgetTestCase):
+    """
+    Fixed query budgets for the flamingo pages which render related objects per row.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        provider = Provider.objects.create(name='St John Ambulance')
+        cls.curriculum = Curriculum.objects.create(course=Course.objects.get(pk=2), provider=provider)
+
+    def test_headers(self):
+        response = self.assertQueryBudget('org-details', 8, 1)
+        self.assertIn('X-Flamingo-DB-Time', response)
+        self.assertIn('X-Flamingo-Duplicate-Queries', response)
+
+    def test_other_requests_not_recorded(self):
+        self.assertNotIn('X-Flamingo-View', self.client.get('/not-flamingo/'))
+
+    def test_org_members(self):
+        self.assertQueryBudget('org-members', 4, 6)
+
+    def test_org_requirements(self):
+        self.assertQueryBudget('org-requirements', 4, 1)
+
+    def test_org_requirement(self):
+        self.assertQueryBudget('org-requirement', 4, 1, 79)
+
+    def test_org_roles(self):
+        response = self.assertQueryBudget('org-roles', 4, 1)
+        self.assertEqual({role.id: role.member_count for role in response.context['roles']}, {19: 2, 20: 1, 24: 2})
+
+    def test_org_users_list(self):
+        response = self.assertQueryBudget('org-users-list', 5, 1, data={'user_search': 'gmail'})
+        user_ids = {user.id for user in response.context['users']}
+        # Members of the organisation are left out of the candidates
+        self.assertEqual(user_ids, {18, 19, 20, 22, 24, 25, 26, 27, 29})
+
+    def test_user_documents(self):
+        self.assertQueryBudget('user-documents', 4, 17)
+
+    def test_curriculum_details(self):
+        self.assertQueryBudget('curriculums-details', 3, self.curriculum.pk)
+
+
+class CurriculumTests(TestCase):
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        provider = Provider.objects.create(name='St John Ambulance')
+        self.curriculum = Curriculum.objects.create(course=Course.objects.get(pk=2), provider=provider)
+        for user, attained_date in [(21, date(2016, 1, 1)), (21, date(2017, 1, 1)), (17, date(2017, 1, 1))]:
+            Qualification.objects.create(user_id=user, course_id=2, provider=provider, verification_status='VERIFIED',
+                                         attained_date=attained_date)
+
+    def test_holder_count(self):
+        response = self.client.get(reverse('flamingo:curriculums-list'))
+        self.assertEqual([curriculum.holder_count for curriculum in response.context['curriculums']], [2])
+
+    def test_holders(self):
+        url = reverse('flamingo:curriculums-details', args=[self.curriculum.pk])
+        response = self.client.get(url)
+        self.assertFalse(response.context['page_obj'].has_next())
+        self.assertEqual(sorted(user.id for user in response.context['users']), [17, 21])
+
+
+class KeysetPaginationTests(TestCase):
+    fixtures = ['test_data.json']
+
+    def page_link(self, response, label):
+        match = re.search(r'href="([^"]*)">{}</a>'.format(label), response.content.decode())
+        return reverse('flamingo:user-list') + html.unescape(match.group(1))
+
+    def test_user_list_pages(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('flamingo:user-list'), {'usr': 'gmail'})
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+        first = [user.id for user in response.context['users']]
+        page = response.context['page_obj']
+        self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+        # The page links keep the search
+        response = self.client.get(self.page_link(response, '&raquo;'))
+        second = [user.id for user in response.context['users']]
+        page = response.context['page_obj']
+        self.assertFalse(page.has_next())
+        self.assertEqual(len(set(first + second)), 14)
+
+        response = self.client.get(self.page_link(response, '&laquo;'))
+        self.assertEqual([user.id for user in response.context['users']], first)
+
+    def test_nullable_ordering(self):
+        self.assertEqual(keyset_ordering(Member.objects.order_by('-user__last_name')),
+                         [('user__last_name', True), ('pk', False)])
+        # NULLs cannot be compared with __gt, and a relation orders by its model's ordering
+        self.assertIsNone(keyset_ordering(Qualification.objects.order_by('expiry_date')))
+        self.assertIsNone(keyset_ordering(Member.objects.order_by('user')))
+        paginator, page = paginate(Qualification.objects.order_by('expiry_date'), 10, 'not-a-number')
+        self.assertEqual(page.number, 1)
+
+
+class RelationEditTests(TestCase):
+    fixtures = ['test_data.json']
+
+    def test_edit_requirement(self):
+        url = reverse('flamingo:org-requirement-edit', args=[1, 79])
+        response = self.client.post(url, {'primary': 2, 'alternatives': [7, 6], 'roles': [19, 24]})
+        self.assertRedirects(response, reverse('flamingo:org-requirements', args=[1]), fetch_redirect_response=False)
+        requirement = RoleRequirements.objects.get(pk=79)
+        self.assertEqual(requirement.name, 'First Aid Certificate')
+        self.assertEqual(set(requirement.roles.values_list('id', flat=True)), {19, 24})
+        self.assertEqual(set(requirement.courses.values_list('id', flat=True)), {2, 6, 7})
+
+    def test_edit_role(self):
+        url = reverse('flamingo:org-role-edit', args=[1, 20])
+        response = self.client.post(url, {'name': 'Head Coach', 'requirements': [80, 81]})
+        self.assertRedirects(response, reverse('flamingo:org-role', args=[1, 20]), fetch_redirect_response=False)
+        role = Role.objects.get(pk=20)
+        self.assertEqual(role.name, 'Head Coach')
+        self.assertEqual(set(role.role_requirements.values_list('id', flat=True)), {80, 81})
+
+
+class MemberImportTests(EagerTasksMixin, TestCase):
+    fixtures = ['test_data.json']
+
+    def test_import(self):
+        csv_file = SimpleUploadedFile('members.csv', b'email,first_name,last_name,phone,level,roles\n'
+                                                     b'new.person@gmail.com,New,Person,0400000000,,Referee\n'
+                                                     b'lily.hughes@gmail.com,Lily,Hughes,,admin,Manager;Referee\n'
+                                                     b'ella.thomson@gmail.com,Ella,Thomson,,,\n'
+                                                     b'not-an-email,,,,,\n')
+        response = self.client.post(reverse('flamingo:org-members-import', args=[1]), {'csv_file': csv_file})
+        self.assertEqual(response.status_code, 302)
+
+        progress = self.client.get(response['Location'], HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+        self.assertEqual(progress['status'], 'DONE')
+        self.assertEqual(progress['rows'], 4)
+        self.assertEqual(progress['users_created'], 1)
+        self.assertEqual(progress['members_created'], 2)
+        self.assertEqual(progress['already_members'], 1)
+        self.assertEqual(progress['invalid'], 1)
+
+        member = Member.objects.get(organisation=1, user__email='lily.hughes@gmail.com')
+        self.assertEqual(member.level, 'ADMIN')
+        self.assertEqual(set(member.roles.values_list('id', flat=True)), {19, 24})
+
+    def test_matches_existing_email_case_insensitively(self):
+        users = User.objects.count()
+        csv_file = SimpleUploadedFile('members.csv', b'email,first_name,last_name,phone,level,roles\n'
+                                                     b'Lily.Hughes@Gmail.COM,Lily,Hughes,,,Referee\n'
+                                                     b'lily.hughes@gmail.com,Lily,Hughes,,,\n')
+        response = self.client.post(reverse('flamingo:org-members-import', args=[1]), {'csv_file': csv_file})
+
+        progress = self.client.get(response['Location'], HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+        self.assertEqual(progress['users_created'], 0)
+        self.assertEqual(progress['members_created'], 1)
+        self.assertEqual(progress['invalid'], 1)
+        self.assertEqual(User.objects.count(), users)
+        member = Member.objects.get(organisation=1, user__email='lily.hughes@gmail.com')
+        self.assertEqual(set(member.roles.values_list('id', flat=True)), {24})
+
+    def test_rejects_file_without_header(self):
+        csv_file = SimpleUploadedFile('members.csv', b'new.person@gmail.com,New,Person\n')
+        response = self.client.post(reverse('flamingo:org-members-import', args=[1]), {'csv_file': csv_file})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors)
+
+
+class ExportTests(TestCase):
+    fixtures = ['test_data.json']
+
+    def test_members_csv(self):
+        response = self.client.get(reverse('flamingo:org-members-export', args=[6]))
+        content = b''.join(response.streaming_content).decode('utf-8')
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], MEMBER_COLUMNS)
+        self.assertEqual(len(rows), 7)
+        adrian = ['53', 'adrian.clark@gmail.com', 'Adrian', 'Clark', '0457683920', '', 'Manager; Receptionist', '']
+        self.assertIn(adrian, rows)
+
+    def test_documents_unknown_user(self):
+        response = self.client.get(reverse('flamingo:user-documents-export', args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_requirements_json(self):
+        response = self.client.get(reverse('flamingo:org-requirements-export', args=[1]), {'format': 'json'})
+        requirements = json.loads(b''.join(response.streaming_content).decode('utf-8'))
+        self.assertEqual(len(requirements), 3)
+        first_aid = next(requirement for requirement in requirements if requirement['id'] == 79)
+        self.assertEqual(first_aid['primary'], 'First Aid Certificate')
+        self.assertEqual(first_aid['alternatives'], 'Provide CPR')
+        self.assertEqual(first_aid['roles'], 'Basketball Coach')
+
+
+class CourseChoicesTests(TestCase):
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        invalidate_course_choices()
+        self.addCleanup(invalidate_course_choices)
+
+    def test_requirement_form_choices(self):
+        org = Organisation.objects.get(pk=1)
+        AddRequirementForm(org=org)
+        # Courses come from the cache, leaving the primaries and roles queries
+        with self.assertNumQueries(2):
+            form = AddRequirementForm(org=org)
+        primary = dict(form.fields['primary'].choices)
+        self.assertNotIn(2, primary)
+        self.assertEqual(primary[3], 'Level 1 Football Coaching')
+
+        course = Course.objects.get(pk=3)
+        course.title = 'Level 2 Football Coaching'
+        course.save()
+        form = AddRequirementForm(org=org)
+        self.assertEqual(dict(form.fields['alternatives'].choices)[3], 'Level 2 Football Coaching')
+
+    @override_settings(FLAMINGO_COURSE_CHOICES_TIMEOUT=0)
+    def test_choices_expire(self):
+        org = Organisation.objects.get(pk=1)
+        AddRequirementForm(org=org)
+        # A change made by another worker is not seen by this process's signal handlers
+        Course.objects.filter(pk=3).update(title='Level 2 Football Coaching')
+        form = AddRequirementForm(org=org)
+        self.assertEqual(dict(form.fields['alternatives'].choices)[3], 'Level 2 Football Coaching')
+
+
+class ComplianceTests(TestCase):
+    fixtures = ['test_data.json']
+
+    def test_evaluate_compliance(self):
+        org = Organisation.objects.get(pk=1)
+        with self.assertNumQueries(6):
+            matrix = evaluate_compliance(org)
+        self.assertEqual([requirement.id for requirement in matrix.requirements], [79, 81, 80])
+        rows = {row.member_id: row for row in matrix.rows}
+        # Member 48 has no roles, so nothing applies to them
+        self.assertEqual(rows[48].statuses, [None, None, None])
+        self.assertTrue(rows[48].compliant)
+        self.assertEqual(rows[62].statuses, [False, None, False])
+        self.assertEqual(rows[64].statuses, [None, False, False])
+        self.assertEqual(matrix.compliant_count, 1)
+
+    def test_rebuild_compliance(self):
+        call_command('rebuild_compliance', organisations=[1], stdout=io.StringIO())
+        statuses = ComplianceStatus.objects.filter(member=62).values_list('requirement_id', 'compliant')
+        self.assertEqual(sorted(statuses), [(79, False), (80, False)])
+        org = Organisation.objects.get(pk=1)
+        self.assertEqual([row.statuses for row in snapshot_matrix(org).rows],
+                         [row.statuses for row in evaluate_compliance(org).rows])
+
+    def test_compliance_page(self):
+        refresh_compliance(Organisation.objects.get(pk=1))
+        response = self.client.get(reverse('flamingo:org-compliance', args=[1]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['rows']), 5)
+        self.assertEqual(response.context['matrix'].compliant_count, 1)
+
+    def test_snapshot_page(self):
+        org = Organisation.objects.get(pk=1)
+        refresh_compliance(org)
+        members = list(compliance_members(org))
+        page = [member for member in members if member[0] in (48, 62)]
+        with CaptureQueriesContext(connection) as queries:
+            matrix = snapshot_matrix(org, page, len(members))
+        # Only the page's statuses are read, and the compliant members are counted in SQL
+        self.assertEqual(len(queries), 3)
+        self.assertEqual([row.member_id for row in matrix.rows], [member[0] for member in page])
+        self.assertEqual((matrix.compliant_count, matrix.member_count, matrix.compliance_rate), (1, 5, 20))
+
+
+class ExpiryTests(TestCase):
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        cache.clear()
+        provider = Provider.objects.create(name='Basketball Victoria')
+        self.today = date(2018, 3, 1)
+
+        def qualification(user, course, expiry_date, visible_to=(1,)):
+            qualification = Qualification.objects.create(
+                user_id=user, course_id=course, provider=provider, verification_status='VERIFIED',
+                attained_date=date(2017, 1, 1), expiry_date=expiry_date)
+            qualification.organisations.set(visible_to)
+            return qualification
+        self.lapsed = qualification(21, 1, date(2018, 2, 1))
+        self.lapsed_other = qualification(17, 2, date(2018, 2, 28), visible_to=(1, 6))
+        # User 17 is a member of organisation 6 too, but kept this one to themselves
+        self.lapsed_private = qualification(17, 1, date(2018, 2, 10), visible_to=())
+        # Already in the warning period yesterday, so its holder's admins were told then
+        self.warned = qualification(21, 7, date(2018, 3, 20))
+        self.expiring = qualification(21, 2, date(2018, 3, 31))
+        self.current = qualification(21, 6, date(2019, 1, 1))
+
+    def test_check_expiry(self):
+        result = check_expiry(today=self.today, days=30, batch_size=1)
+        self.assertEqual(result, {'expired': 3, 'expiring': 1, 'notified': 2})
+        self.assertEqual(set(Qualification.objects.filter(verification_status='EXPIRED').values_list('id', flat=True)),
+                         {self.lapsed.id, self.lapsed_other.id, self.lapsed_private.id})
+        # User 28 administers organisation 1 and user 24 organisation 6
+        digest = Notification.objects.get(recipient=28)
+        self.assertEqual(digest.description,
+                         '2 qualifications of your members expired and 1 will expire within 30 days.')
+        self.assertEqual(Notification.objects.get(recipient=24).description,
+                         '1 qualification of your members expired.')
+
+    def test_warned_once(self):
+        check_expiry(today=self.today, days=30)
+        self.assertEqual(check_expiry(today=self.today + timedelta(days=1), days=30),
+                         {'expired': 0, 'expiring': 0, 'notified': 0})
+        # A missed day is caught up on the next run
+        self.current.expiry_date = date(2018, 4, 2)
+        self.current.save()
+        self.assertEqual(check_expiry(today=date(2018, 3, 3), days=30)['expiring'], 1)
+
+
+class FragmentCacheTests(EagerTasksMixin, TransactionTestCase):
+    # Versions are bumped when the transaction commits, which TestCase never does
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_warm_requirements_page(self):
+        url = reverse('flamingo:org-requirements', args=[1])
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.get(url)
+        self.assertContains(response, 'Working With Children Check')
+        self.assertLess(len(warm), len(cold))
+        self.assertFalse(any('rolerequirements_courses' in query['sql'] for query in warm.captured_queries))
+
+    def test_edit_role_renders_fragments_again(self):
+        self.assertContains(self.client.get(reverse('flamingo:org-members', args=[1])), 'Basketball Coach')
+        self.client.post(reverse('flamingo:org-role-edit', args=[1, 20]), {'name': 'Head Coach', 'requirements': [79]})
+        response = self.client.get(reverse('flamingo:org-members', args=[1]))
+        self.assertContains(response, 'Head Coach')
+        self.assertNotContains(response, 'Basketball Coach')
+
+
+class ComplianceSignalTests(EagerTasksMixin, TransactionTestCase):
+    # The refreshes are scheduled on commit, which TestCase never does
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        super().setUp()
+        refresh_compliance(Organisation.objects.get(pk=1))
+
+    def statuses(self, member_id):
+        return dict(ComplianceStatus.objects.filter(member=member_id).values_list('requirement_id', 'compliant'))
+
+    def test_edit_qualification(self):
+        # Member 62 (user 21) is a Basketball Coach, which needs requirements 79 and 80
+        self.assertEqual(self.statuses(62), {79: False, 80: False})
+        provider = Provider.objects.create(name='St John Ambulance')
+        qualification = Qualification.objects.create(user_id=21, course_id=2, provider=provider,
+                                                     verification_status='VERIFIED', attained_date=date(2017, 1, 1))
+        self.assertEqual(self.statuses(62), {79: True, 80: False})
+        qualification.verification_status = 'EXPIRED'
+        qualification.save()
+        self.assertEqual(self.statuses(62), {79: False, 80: False})
+
+    def test_edit_member_roles(self):
+        member = Member.objects.get(pk=62)
+        member.roles.add(24)
+        self.assertEqual(self.statuses(62), {79: False, 80: False, 81: False})
+        member.roles.remove(20)
+        self.assertEqual(self.statuses(62), {80: False, 81: False})
+
+    def test_one_refresh_per_transaction(self):
+        url = reverse('flamingo:org-requirement-edit', args=[1, 79])
+        with mock.patch.object(tasks.refresh_compliance, 'delay') as delay:
+            # Saves the requirement and changes its roles and courses, each of which sends signals
+            self.client.post(url, {'primary': 2, 'alternatives': [7, 6], 'roles': [19, 24]})
+        delay.assert_called_once_with(1, None)
+
+    def test_member_refreshes_merged(self):
+        with mock.patch.object(tasks.refresh_compliance, 'delay') as delay:
+            with transaction.atomic():
+                Member.objects.get(pk=62).roles.add(24)
+                Member.objects.get(pk=63).roles.add(24)
+        delay.assert_called_once_with(1, [62, 63])
+
+    def test_edit_requirements(self):
+        RoleRequirements.objects.get(pk=81).roles.add(20)
+        self.assertEqual(self.statuses(62), {79: False, 80: False, 81: False})
+        # Unlinked from the role side, with a clear
+        Role.objects.get(pk=20).role_requirements.clear()
+        self.assertEqual(self.statuses(62), {})
+        self.assertEqual(self.statuses(63), {80: False})
+
+
+class OrganisationResolverTests(TestCase):
+    fixtures = ['test_data.json']
+
+    def test_missing_organisation(self):
+        for url_name in ['org-details', 'org-members', 'org-members-add', 'org-roles', 'org-requirement-add']:
+            response = self.client.get(reverse('flamingo:' + url_name, args=[999]))
+            self.assertEqual(response.status_code, 404, url_name)
+
+    def test_object_from_another_organisation(self):
+        # Role 20 belongs to organisation 1
+        response = self.client.get(reverse('flamingo:org-role-edit', args=[6, 20]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_organisation_loaded_once(self):
+        response = self.client.get(reverse('flamingo:org-role-add', args=[1]))
+        organisation = response.context['organisation']
+        self.assertIs(response.context['req_form'].organisation, organisation)
+        with self.assertNumQueries(0):
+            organisation.industry
+
+
+class TypeaheadTests(TestCase):
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        typeahead_cache.clear()
+
+    def test_organisation_typeahead(self):
+        url = reverse('flamingo:org-typeahead')
+        response = self.client.get(url, {'q': 'hippo'})
+        self.assertEqual(response.json(), [{'id': 6, 'label': 'Happy Hippos Childcare'}])
+        self.assertIn('max-age=30', response['Cache-Control'])
+        # The same term is answered from the process cache
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, {'q': 'Hippo'}).json()[0]['id'], 6)
+
+    def test_user_typeahead_is_capped(self):
+        response = self.client.get(reverse('flamingo:user-typeahead'), {'q': 'gmail'})
+        suggestions = response.json()
+        self.assertEqual(len(suggestions), TYPEAHEAD_LIMIT)
+        self.assertTrue(all('@gmail.com' in suggestion['label'] for suggestion in suggestions))
+
+    def test_empty_term(self):
+        self.assertEqual(self.client.get(reverse('flamingo:courses-typeahead')).json(), [])
+
+
+class ConditionalGetTests(TestCase):
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        cache.clear()
+
+    def assertNotModified(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        return response
+
+    def test_not_modified(self):
+        for url in [reverse('flamingo:org-details', args=[1]), reverse('flamingo:org-member', args=[1, 62]),
+                    reverse('flamingo:org-role', args=[1, 20]), reverse('flamingo:org-requirement', args=[1, 79]),
+                    reverse('flamingo:user-details', args=[21]), reverse('flamingo:user-documents', args=[21])]:
+            self.assertNotModified(url)
+
+    def test_version_change(self):
+        url = reverse('flamingo:user-details', args=[21])
+        etag = self.client.get(url)['ETag']
+        # A change to an organisation the user belongs to changes the page. Versions move on
+        # commit, which TestCase never does, so set it directly.
+        cache.set(version_key('org', 1), organisation_version(1) + 1, None)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_role_holder_change(self):
+        url = reverse('flamingo:org-role', args=[1, 20])
+        etag = self.client.get(url)['ETag']
+        # Member 62 holds the role, and the page shows their user's details
+        cache.set(version_key('user', 21), user_version(21) + 1, None)
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+    def test_last_modified(self):
+        url = reverse('flamingo:org-details', args=[1])
+        # Changed within the last second, so a later change could still get the same date
+        self.assertFalse(self.client.get(url).has_header('Last-Modified'))
+        cache.set(version_key('org', 1), 1500000000123, None)
+        response = self.client.get(url)
+        self.assertEqual(response['Last-Modified'], 'Fri, 14 Jul 2017 02:40:00 GMT')
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+
+class StaticFilesStorageTests(SimpleTestCase):
+
+    def test_post_process(self):
+        source = FileSystemStorage(location=os.path.join(os.path.dirname(__file__), 'static'))
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        storage = FlamingoStaticFilesStorage(location=root, base_url='/static/')
+        paths = {}
+        for name in ['css/base.css', 'css/multi-select.css', 'img/flamingo-lrg.png']:
+            with source.open(name) as original:
+                storage.save(name, original)
+            paths[name] = (source, name)
+        list(storage.post_process(paths))
+
+        css = storage.stored_name('css/base.css')
+        self.assertRegex(css, r'^css/base\.[0-9a-f]{12}\.css$')
+        with storage.open(css) as hashed:
+            content = hashed.read()
+        with storage.open(css + '.gz') as compressed:
+            self.assertEqual(gzip.decompress(compressed.read()), content)
+        with storage.open(css + '.br') as compressed:
+            self.assertEqual(brotli.decompress(compressed.read()), content)
+        # The missing image referenced by the vendored multi-select.css does not fail the build
+        self.assertTrue(storage.exists(storage.stored_name('css/multi-select.css')))
+        png = storage.stored_name('img/flamingo-lrg.png')
+        self.assertLessEqual(storage.size(png), source.size('img/flamingo-lrg.png'))
+        # The image is optimised before it is hashed, so its name fingerprints what is served
+        with storage.open(png) as image:
+            self.assertEqual(png, 'img/flamingo-lrg.{}.png'.format(hashlib.md5(image.read()).hexdigest()[:12]))
+
+
+class AliasView(ReplicaRoutingMixin, View):
+    """
+    Report the database the router picks for reads while handling the request.
+    """
+    def get(self, request):
+        return HttpResponse(router.db_for_read(Member))
+
+    def post(self, request):
+        return HttpResponse(router.db_for_read(Member))
+
+
+REPLICA_DATABASES = dict(settings.DATABASES, replica=dict(settings.DATABASES['default'], TEST={'MIRROR': 'default'}))
+
+
+@override_settings(DATABASE_ROUTERS=['flamingo.routers.FlamingoReplicaRouter'])
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.view = AliasView.as_view()
+
+    def test_without_replica(self):
+        response = self.view(self.factory.get('/'))
+        self.assertEqual(response.content, b'default')
+
+    @override_settings(DATABASES=REPLICA_DATABASES)
+    def test_reads_from_replica(self):
+        self.assertEqual(self.view(self.factory.get('/')).content, b'replica')
+        # Reads outside a flamingo view are left alone
+        self.assertEqual(router.db_for_read(Member), 'default')
+
+    @override_settings(DATABASES=REPLICA_DATABASES)
+    def test_pinned_to_primary_after_write(self):
+        response = self.view(self.factory.post('/'))
+        self.assertEqual(response.content, b'default')
+        self.assertIn(PIN_COOKIE, response.cookies)
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+        self.assertEqual(self.view(request).content, b'default')
+
+
+@override_settings(DATABASE_ROUTERS=['flamingo.routers.FlamingoReplicaRouter'], DATABASES=REPLICA_DATABASES)
+class ReplicaQueryTests(TestCase):
+    """
+    Run the flamingo views against a "replica" connection of their own, which shares the test
+    transaction the way TEST = {'MIRROR': 'default'} shares the test database.
+    """
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        cache.clear()
+        connection.ensure_connection()
+        replica = type(connection)(dict(connection.settings_dict), 'replica')
+        replica.connection = connection.connection
+        connections.databases['replica'] = replica.settings_dict
+        connections['replica'] = replica
+        self.addCleanup(connections.databases.pop, 'replica')
+        self.addCleanup(delattr, connections._connections, 'replica')
+        self.addCleanup(setattr, replica, 'connection', None)
+        self.replica = replica
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(self.replica) as replica:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(primary), len(replica)
+
+    def test_reads_from_replica(self):
+        # The organisation last changed well outside the pin window
+        cache.set(version_key('org', 1), 1500000000000, None)
+        primary, replica = self.get(reverse('flamingo:org-members', args=[1]))
+        self.assertGreater(replica, 0)
+        self.assertLess(primary, replica)
+
+    def test_recent_change_reads_from_primary(self):
+        # Otherwise a page rendered from a replica which has not caught up would be cached,
+        # or given an ETag, under the new version
+        for url in [reverse('flamingo:org-members', args=[1]), reverse('flamingo:org-details', args=[1])]:
+            primary, replica = self.get(url)
+            self.assertGreater(primary, 0)
+            self.assertLess(replica, primary)
+
+    def test_export_streams_from_replica(self):
+        response = self.client.get(reverse('flamingo:org-members-export', args=[6]))
+        with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(self.replica) as replica:
+            content = b''.join(response.streaming_content)
+        self.assertIn(b'adrian.clark@gmail.com', content)
+        self.assertEqual(len(primary), 0)
+        self.assertGreater(len(replica), 0)
+
+
+@modify_settings(MIDDLEWARE={'append': 'flamingo.middleware.MetricsMiddleware'})
+class MetricsTests(TestCase):
+    fixtures = ['test_data.json']
+
+    def sample(self, name, labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_recorded(self):
+        labels = {'view': 'org-details', 'method': 'GET'}
+        before = self.sample('flamingo_requests_total', labels)
+        self.client.get(reverse('flamingo:org-details', args=[1]))
+        self.assertEqual(self.sample('flamingo_requests_total', labels), before + 1)
+        for part in ['total', 'db', 'template', 'python']:
+            self.assertTrue(self.sample('flamingo_request_seconds_count', {'view': 'org-details', 'part': part}))
+
+    def test_other_requests_not_recorded(self):
+        self.assertIsNone(resolve_flamingo_url_name(RequestFactory().get('/not-flamingo/')))
+        self.assertEqual(resolve_flamingo_url_name(RequestFactory().get(reverse('flamingo:org-details', args=[1]))),
+                         'org-details')
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('flamingo:org-details', args=[1]))
+        url = reverse('flamingo:metrics')
+        # Without a token the metrics are for staff only
+        self.assertEqual(self.client.get(url).status_code, 403)
+        User.objects.filter(pk=17).update(is_staff=True)
+        self.client.force_login(User.objects.get(pk=17))
+        response = self.client.get(url)
+        self.assertContains(response, 'flamingo_request_seconds_bucket')
+        self.assertNotContains(response, 'view="metrics"')
+
+    @override_settings(FLAMINGO_METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse('flamingo:metrics')).status_code, 403)
+        response = self.client.get(reverse('flamingo:metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+@modify_settings(MIDDLEWARE={'append': 'flamingo.middleware.SlowRequestMiddleware'})
+@override_settings(FLAMINGO_SLOW_REQUEST_SECONDS=0, FLAMINGO_PROFILE_SAMPLE_RATE=1)
+class SlowRequestTests(EagerTasksMixin, TestCase):
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        super().setUp()
+        clear_slow_requests()
+        self.addCleanup(clear_slow_requests)
+
+    def test_slow_request_recorded(self):
+        self.client.get(reverse('flamingo:org-details', args=[1]))
+        entry, = slow_requests()
+        self.assertEqual(entry['view'], 'org-details')
+        self.assertTrue(entry['queries'])
+        self.assertTrue(entry['queries'][0]['plan'])
+        self.assertIn('cumulative', entry['profile'])
+
+    def test_other_requests_not_recorded(self):
+        self.client.get('/not-flamingo/')
+        self.assertEqual(slow_requests(), [])
+
+    @override_settings(FLAMINGO_SLOW_REQUEST_BUFFER=2)
+    def test_buffer_bounded(self):
+        for pk in [1, 5, 6]:
+            self.client.get(reverse('flamingo:org-details', args=[pk]))
+        self.assertEqual([entry['path'] for entry in slow_requests()],
+                         [reverse('flamingo:org-details', args=[pk]) for pk in [6, 5]])
+
+    def test_staff_only(self):
+        url = reverse('flamingo:slow-requests')
+        user = User.objects.get(pk=17)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        User.objects.filter(pk=17).update(is_staff=True)
+        self.client.get(reverse('flamingo:org-details', args=[1]))
+        self.assertContains(self.client.get(url), reverse('flamingo:org-details', args=[1]))
+
+
+class BenchmarkTests(TestCase):
+    fixtures = ['test_data.json']
+
+    def test_generate_dataset(self):
+        organisations = set(Organisation.objects.values_list('id', flat=True))
+        qualifications = Qualification.objects.count()
+        providers, curriculums = Provider.objects.count(), Curriculum.objects.count()
+        call_command('generate_dataset', organisations=2, users=30, members=10, qualifications=100, seed=1,
+                     batch_size=7, stdout=io.StringIO())
+        # Ten providers, and two for each of the twenty courses
+        self.assertEqual(Provider.objects.count(), providers + 10)
+        self.assertEqual(Curriculum.objects.count(), curriculums + 40)
+        new = Organisation.objects.exclude(id__in=organisations)
+        self.assertEqual(new.count(), 2)
+        self.assertEqual(Member.objects.filter(organisation__in=new).count(), 20)
+        self.assertEqual(Qualification.objects.count(), qualifications + 100)
+        self.assertTrue(RoleRequirements.roles.through.objects.filter(rolerequirements__organisation__in=new).exists())
+        self.assertTrue(ComplianceStatus.objects.filter(organisation__in=new).exists())
+
+    def test_benchmark(self):
+        results = run_benchmark(self.client, runs=2, only=['org-details', 'org-members', 'user-list'])
+        self.assertEqual(set(results), {'org-details', 'org-members', 'user-list'})
+        for result in results.values():
+            self.assertEqual(result['status'], 200)
+            self.assertGreater(result['queries'], 0)
+            self.assertGreater(result['median'], 0)
+            self.assertLessEqual(result['median'], result['p95'])
+        baseline = {name: dict(result, queries=result['queries'] - 1) for name, result in results.items()}
+        self.assertEqual(sorted(compare(results, baseline)), [
+            (name, 'queries {} -> {}'.format(results[name]['queries'] - 1, results[name]['queries']))
+            for name in sorted(results)])
+
+    def test_compare(self):
+        baseline = {'org-details': {'median': 10.0, 'p95': 19.5, 'queries': 3}}
+        # Within the tolerance, or within MIN_REGRESSION_MS of the baseline
+        self.assertEqual(compare({'org-details': {'median': 11.9, 'p95': 20.4, 'queries': 3}}, baseline), [])
+        self.assertEqual(compare({'org-details': {'median': 13.0, 'p95': 20.0, 'queries': 2}}, baseline),
+                         [('org-details', 'median 10.00ms -> 13.00ms')])
+
+
+class BulkDeleteTests(TestCase):
+    fixtures = ['test_data.json']
+
+    def test_unlink_members(self):
+        # Member 49 belongs to organisation 6, so it is left alone
+        response = self.client.post(reverse('flamingo:org-members-unlink', args=[1]), {'ids': [61, 64, 49]})
+        self.assertRedirects(response, reverse('flamingo:org-members', args=[1]), fetch_redirect_response=False)
+        self.assertEqual(set(Member.objects.filter(id__in=[61, 64, 49]).values_list('id', flat=True)), {49})
+        self.assertFalse(Member.roles.through.objects.filter(member_id__in=[61, 64]).exists())
+        self.assertTrue(Member.objects.filter(id=63, roles=19).exists())
+
+    def test_delete_roles(self):
+        self.client.post(reverse('flamingo:org-roles-delete', args=[1]), {'ids': [20, 24]})
+        self.assertEqual(set(Role.objects.filter(organisation=1).values_list('id', flat=True)), {19})
+        self.assertEqual(list(Member.objects.get(id=64).roles.values_list('id', flat=True)), [19])
+        self.assertFalse(RoleRequirements.roles.through.objects.filter(role_id__in=[20, 24]).exists())
+
+    def test_delete_requirements(self):
+        other = RoleRequirements.objects.exclude(organisation=1).first()
+        self.client.post(reverse('flamingo:org-requirements-delete', args=[1]), {'ids': [79, 80, other.id]})
+        self.assertEqual(set(RoleRequirements.objects.filter(organisation=1).values_list('id', flat=True)), {81})
+        self.assertTrue(RoleRequirements.objects.filter(id=other.id).exists())
+        self.assertFalse(RoleRequirements.courses.through.objects.filter(rolerequirements_id__in=[79, 80]).exists())
+
+    def test_post_only(self):
+        self.assertEqual(self.client.get(reverse('flamingo:org-roles-delete', args=[1])).status_code, 405)
+
+
+class SearchBackendTests(TestCase):
+    fixtures = ['test_data.json']
+
+    def names(self, queryset):
+        return [(user.first_name, user.last_name) for user in queryset]
+
+    def test_contains_backend(self):
+        users = ContainsSearchBackend().search(User.objects.order_by('id'), 'SKIN', ['first_name', 'last_name'])
+        self.assertEqual(self.names(users), [('Chloe', 'Skinner'), ('Isacc', 'Skinner')])
+
+    def test_any_field_matches(self):
+        users = ContainsSearchBackend().search(User.objects.order_by('id'), 'ella', ['first_name', 'email'])
+        self.assertEqual(self.names(users), [('Ella', 'Thomson'), ('Ella', 'Randall')])
+
+    @override_settings(FLAMINGO_SEARCH_BACKEND='flamingo.search.ContainsSearchBackend')
+    def test_backend_setting(self):
+        self.assertIsInstance(get_search_backend('default'), ContainsSearchBackend)
+        self.assertNotIsInstance(get_search_backend('default'), TrigramSearchBackend)
+
+    @skipUnless(connection.vendor == 'postgresql', 'trigram similarity needs PostgreSQL')
+    def test_trigram_backend_ranks_matches(self):
+        self.assertIsInstance(get_search_backend('default'), TrigramSearchBackend)
+        users = search(User.objects.order_by('id'), 'Skinner', ['last_name', 'email'])
+        self.assertEqual(self.names(users), [('Chloe', 'Skinner'), ('Isacc', 'Skinner')])
+        # The closest match comes first whatever the queryset's own ordering
+        organisations = search(Organisation.objects.order_by('id'), 'Water Polo', ['name'])
+        self.assertEqual(organisations[0].name, 'Water Polo Victoria')
@@ -1,17 +1,43 @@
+import uuid
+from collections import OrderedDict
 from datetime import datetime
 
-from django.db.models import Q
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
-from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.files.storage import default_storage
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import transaction
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
 from django.views import generic
 from django.views.generic import TemplateView
 
 from accounts.models import User
 from courses.models import Course, Curriculum, Provider, Qualification
+from flamingo import profiling, tasks
+from flamingo.bulk import delete_rows
+from flamingo.caching import bump_organisation_version
+from flamingo.compliance import compliance_members, snapshot_matrix
+from flamingo.conditional import (MemberConditionalGetMixin,
+                                  OrgConditionalGetMixin,
+                                  RoleConditionalGetMixin,
+                                  UserConditionalGetMixin)
+from flamingo.exports import (MEMBER_COLUMNS, QUALIFICATION_COLUMNS,
+                              REQUIREMENT_COLUMNS, export_response,
+                              member_rows, qualification_rows,
+                              requirement_rows)
 from flamingo.forms import (AddMemberForm, AddRequirementForm, AddRoleForm,
                             AddUserForm, EditRequirementForm,
-                            SelectRoleRequirementsForm)
+                            ImportMembersForm, SelectRoleRequirementsForm)
+from flamingo.imports import IMPORT_COLUMNS, get_progress, set_progress
+from flamingo.pagination import KeysetPaginationMixin, paginate
+from flamingo.resolvers import get_organisation
+from flamingo.routers import ReplicaRoutingMixin, replica_routing
+from flamingo.search import search
+from flamingo.signals import schedule_compliance_refresh
 from organisations.models import Member, Organisation, Role, RoleRequirements
 
 
@@ -19,10 +45,15 @@ class OrgContextMixin(object):
     """
     Pass organisation context to any view.
     """
+    org_kwarg = 'pk'
+
+    @property
+    def organisation(self):
+        return get_organisation(self.request, self.kwargs[self.org_kwarg])
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        org = Organisation.objects.get(pk=self.kwargs['pk'])
-        context['organisation'] = org
+        context['organisation'] = self.organisation
         return context
 
 
@@ -77,6 +108,41 @@ class RequirementsNavbarMixin(object):
         return context
 
 
+class ComplianceNavbarMixin(object):
+    """
+    Pass context into navbar that we're in compliance tab
+    """
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['nbar'] = 'compliance'
+        return context
+
+
+class OrgVersionMixin(object):
+    """
+    Bump the cache version of the organisation once a form saves or an object is deleted,
+    so its cached template fragments are rendered again.
+    """
+    org_kwarg = 'pk'
+
+    def get_version_organisations(self):
+        return [self.kwargs[self.org_kwarg]]
+
+    def bump_versions(self):
+        for org_id in self.get_version_organisations():
+            bump_organisation_version(org_id)
+
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        self.bump_versions()
+        return response
+
+    def delete(self, request, *args, **kwargs):
+        response = super().delete(request, *args, **kwargs)
+        self.bump_versions()
+        return response
+
+
 class AjaxableResponseMixin(object):
     """
     Mixin to add AJAX support to a form.
@@ -89,7 +155,7 @@ class AjaxableResponseMixin(object):
         return response
 
 
-class OrgList(generic.ListView):
+class OrgList(ReplicaRoutingMixin, KeysetPaginationMixin, generic.ListView):
     """
     List organisations and filter by a search term.
     """
@@ -100,21 +166,25 @@ class OrgList(generic.ListView):
 
     def get_queryset(self):
         queryset = super().get_queryset()
+        queryset = queryset.order_by('id')
         query = self.request.GET.get('org')
         if query is not None:
-            queryset = Organisation.objects.filter(name__icontains=query)
-        return queryset.order_by('id')
+            queryset = search(queryset, query, ['name'])
+        return queryset
 
 
-class OrgDetails(DetailsNavbarMixin, generic.DetailView):
+class OrgDetails(ReplicaRoutingMixin, OrgConditionalGetMixin, DetailsNavbarMixin, OrgContextMixin, generic.DetailView):
     """
     Display the details of an organisation.
     """
     model = Organisation
     template_name = 'flamingo/organisations/org_details.html'
 
+    def get_object(self, queryset=None):
+        return self.organisation
+
 
-class EditDetails(DetailsNavbarMixin, generic.UpdateView):
+class EditDetails(ReplicaRoutingMixin, OrgVersionMixin, DetailsNavbarMixin, OrgContextMixin, generic.UpdateView):
     """
     Edit the details of an organisation.
     """
@@ -122,21 +192,45 @@ class EditDetails(DetailsNavbarMixin, generic.UpdateView):
     fields = ['name', 'address', 'industry']
     template_name = 'flamingo/organisations/org_details_edit.html'
 
+    def get_object(self, queryset=None):
+        return self.organisation
+
     def get_success_url(self, *args, **kwargs):
         org_id = self.request.POST.get('org')
         return reverse('flamingo:org-details', args=[org_id])
 
 
-class OrgMembers(MembersNavbarMixin, OrgContextMixin, OrgQuerysetMixin, generic.ListView):
+class OrgMembers(ReplicaRoutingMixin, MembersNavbarMixin, OrgContextMixin, OrgQuerysetMixin, generic.ListView):
     """
     List the members in an organisation.
     """
     model = Member
     context_object_name = 'members'
     template_name = 'flamingo/organisations/org_members.html'
+    paginate_by = 50
+    # Orderings selectable with the "sort" query parameter, admins first by default
+    orderings = {
+        'level': ['-level', 'user__last_name', 'user__first_name', 'id'],
+        'name': ['user__last_name', 'user__first_name', 'id'],
+        'email': ['user__email', 'id'],
+    }
 
+    def get_sort(self):
+        sort = self.request.GET.get('sort')
+        return sort if sort in self.orderings else 'level'
 
-class OrgUserList(MembersNavbarMixin, OrgContextMixin, generic.ListView):
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        queryset = queryset.select_related('user').prefetch_related('roles')
+        return queryset.order_by(*self.orderings[self.get_sort()])
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['sort'] = self.get_sort()
+        return context
+
+
+class OrgUserList(ReplicaRoutingMixin, MembersNavbarMixin, OrgContextMixin, KeysetPaginationMixin, generic.ListView):
     """
     List users searched when attempting to link a user as a member to an organisation.
     """
@@ -147,22 +241,21 @@ class OrgUserList(MembersNavbarMixin, OrgContextMixin, generic.ListView):
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        search_term = self.request.GET.get('user_search')
-        queryset = queryset.filter((Q(first_name__icontains=search_term)
-                                    | Q(last_name__icontains=search_term)
-                                    | Q(email__icontains=search_term)))
-        org_id = self.kwargs['pk']
-        members = Member.objects.filter(user__in=queryset).filter(organisation__in=org_id)
-        for member in members:
-            queryset = queryset.exclude(id=member.user.id)
-        return queryset.order_by('id')
+        search_term = self.request.GET.get('user_search', '')
+        # Anti-join against this organisation's members so users already linked are left out
+        memberships = Member.objects.filter(organisation=self.kwargs['pk'], user=OuterRef('pk'))
+        queryset = queryset.annotate(is_member=Exists(memberships)).filter(is_member=False)
+        # Memberships are listed next to each user in the results
+        queryset = queryset.prefetch_related('memberships__organisation')
+        return search(queryset.order_by('id'), search_term, ['first_name', 'last_name', 'email'])
 
 
+@replica_routing
 def add_member(request, pk):
     """
     Creates a user and a member, linking them to an organisation.
     """
-    org = Organisation.objects.get(pk=pk)
+    org = get_organisation(request, pk)
     if request.method == 'POST':
         user_form = AddUserForm(data=request.POST, prefix='user')
         member_form = AddMemberForm(data=request.POST, organisation=org, prefix='member')
@@ -174,6 +267,7 @@ def add_member(request, pk):
             member.save()
             # Since save is called initially with commit=False, many to many save must be used to save the roles field
             member_form.save_m2m()
+            bump_organisation_version(org.id)
             return HttpResponseRedirect(reverse('flamingo:org-members', args=[pk]))
         else:
             # TODO: Display in template
@@ -191,12 +285,66 @@ def add_member(request, pk):
     return render(request, 'flamingo/organisations/org_members_add.html', context_dict)
 
 
+@replica_routing
+def export_members(request, pk):
+    """
+    Stream every member of an organisation, with their roles and qualifications, as CSV or JSON.
+    """
+    org = get_organisation(request, pk)
+    return export_response(request, 'members', MEMBER_COLUMNS, member_rows(org))
+
+
+@replica_routing
+def import_members(request, pk):
+    """
+    Upload a CSV of members and import it into an organisation in the background.
+    """
+    org = get_organisation(request, pk)
+    if request.method == 'POST':
+        form = ImportMembersForm(data=request.POST, files=request.FILES)
+        if form.is_valid():
+            import_id = uuid.uuid4().hex
+            # The file is handed to the worker through storage rather than the task arguments
+            path = default_storage.save('flamingo/imports/{}.csv'.format(import_id), form.cleaned_data['csv_file'])
+            set_progress(import_id, {'organisation': org.id, 'status': 'PENDING', 'rows': 0})
+            tasks.import_members.delay(org.id, path, import_id)
+            return HttpResponseRedirect(reverse('flamingo:org-members-import-progress', args=[pk, import_id]))
+    else:
+        form = ImportMembersForm()
+    context = {
+        'form': form,
+        'columns': IMPORT_COLUMNS,
+        'organisation': org,
+        'nbar': 'members'
+    }
+    return render(request, 'flamingo/organisations/org_members_import.html', context)
+
+
+@replica_routing
+def import_members_progress(request, pk, import_id):
+    """
+    Show the progress of a member import. Polling requests are answered with JSON.
+    """
+    progress = get_progress(import_id)
+    if progress is None or str(progress.get('organisation')) != pk:
+        raise Http404('No such import')
+    if request.is_ajax():
+        return JsonResponse(progress)
+    context = {
+        'progress': progress,
+        'organisation': get_organisation(request, pk),
+        'nbar': 'members'
+    }
+    return render(request, 'flamingo/organisations/org_members_import_progress.html', context)
+
+
+@replica_routing
 def edit_member(request, pk, member_pk):
     """
     Edit a member's details (and the relevant user) who belongs to an organisation.
     """
-    member = Member.objects.get(pk=member_pk)
-    org = Organisation.objects.get(pk=pk)
+    org = get_organisation(request, pk)
+    member = get_object_or_404(Member.objects.select_related('user'), pk=member_pk, organisation=org)
     if request.method == 'POST':
         user_form = AddUserForm(data=request.POST, prefix='user', instance=member.user)
         member_form = AddMemberForm(data=request.POST, organisation=org, prefix='member', instance=member)
@@ -208,6 +356,7 @@ def edit_member(request, pk, member_pk):
             member.save()
             # Since save is called initially with commit=False, many to many save must be used to save the roles field
             member_form.save_m2m()
+            bump_organisation_version(org.id)
             return HttpResponseRedirect(reverse('flamingo:org-member', args=[pk, member.id]))
         else:
             # TODO: Produce an error msg
@@ -226,14 +375,15 @@ def edit_member(request, pk, member_pk):
     return render(request, 'flamingo/organisations/org_members_edit.html', context_dict)
 
 
-class OrgUserSearch(MembersNavbarMixin, OrgContextMixin, TemplateView):
+class OrgUserSearch(ReplicaRoutingMixin, MembersNavbarMixin, OrgContextMixin, TemplateView):
     """
     Search for users to later link as members within an organisation.
     """
     template_name = 'flamingo/organisations/org_users_search.html'
 
 
-class MemberDetails(MembersNavbarMixin, OrgContextMixin, generic.DetailView):
+class MemberDetails(ReplicaRoutingMixin, MemberConditionalGetMixin, MembersNavbarMixin, OrgContextMixin,
+                    OrgQuerysetMixin, generic.DetailView):
     """
     Display the details of a member.
     """
@@ -243,12 +393,13 @@ class MemberDetails(MembersNavbarMixin, OrgContextMixin, generic.DetailView):
     pk_url_kwarg = 'member_pk'
 
 
+@replica_routing
 def link_user(request, org_id, user_id):
     """
     Link a user to an organisation by creating a member object.
     """
-    org = Organisation.objects.get(pk=org_id)
-    user = User.objects.get(pk=user_id)
+    org = get_organisation(request, org_id)
+    user = get_object_or_404(User, pk=user_id)
     if request.method == 'POST':
         form = AddMemberForm(data=request.POST, organisation=org)
         if form.is_valid():
@@ -258,6 +409,7 @@ def link_user(request, org_id, user_id):
             member.save()
             # Since save is called initially with commit=False, many to many save must be used to save the roles field
             form.save_m2m()
+            bump_organisation_version(org.id)
             return HttpResponseRedirect(reverse('flamingo:org-members', args=[org_id]))
         else:
             # TODO: Produce an error msg
@@ -273,7 +425,7 @@ def link_user(request, org_id, user_id):
     return render(request, 'flamingo/organisations/org_link_details.html', context_dict)
 
 
-class UnlinkMember(MembersNavbarMixin, generic.DeleteView):
+class UnlinkMember(ReplicaRoutingMixin, OrgVersionMixin, MembersNavbarMixin, generic.DeleteView):
     """
     Unlink a member from an organisation by deleting the member object.
     """
@@ -282,6 +434,7 @@ class UnlinkMember(MembersNavbarMixin, generic.DeleteView):
     slug_field = 'organisation'
     pk_url_kwarg = 'member_id'
     query_pk_and_slug = True
+    org_kwarg = 'org_id'
 
     def get_success_url(self):
         org_id = self.kwargs['org_id']
@@ -289,7 +442,81 @@ class UnlinkMember(MembersNavbarMixin, generic.DeleteView):
         return url
 
 
-class OrgRequirements(RequirementsNavbarMixin, OrgContextMixin, OrgQuerysetMixin, generic.ListView):
+class BulkDeleteView(ReplicaRoutingMixin, generic.View):
+    """
+    Delete the objects of an organisation ticked in its list, posted as ids.
+
+    Ids from other organisations are ignored. The objects, their many-to-many rows and
+    anything else depending on them go in one transaction, a single DELETE per table.
+    """
+    http_method_names = ['post']
+    model = None
+    success_url_name = None
+
+    def get_queryset(self, organisation):
+        return self.model.objects.filter(organisation=organisation)
+
+    def deleted(self, organisation):
+        """
+        Bring what the delete signals would have updated up to date.
+        """
+        bump_organisation_version(organisation.id)
+
+    def post(self, request, pk):
+        organisation = get_organisation(request, pk)
+        ids = [value for value in request.POST.getlist('ids') if value.isdigit()]
+        if ids:
+            with transaction.atomic():
+                if delete_rows(self.get_queryset(organisation).filter(id__in=ids)):
+                    self.deleted(organisation)
+        return HttpResponseRedirect(reverse(self.success_url_name, args=[pk]))
+
+
+class BulkUnlinkMembers(BulkDeleteView):
+    """
+    Unlink the selected members from an organisation.
+    """
+    model = Member
+    success_url_name = 'flamingo:org-members'
+
+
+class BulkDeleteRequirements(BulkDeleteView):
+    """
+    Delete the selected requirements of an organisation.
+    """
+    model = RoleRequirements
+    success_url_name = 'flamingo:org-requirements'
+
+
+class BulkDeleteRoles(BulkDeleteView):
+    """
+    Delete the selected roles of an organisation.
+    """
+    model = Role
+    success_url_name = 'flamingo:org-roles'
+
+    def deleted(self, organisation):
+        super().deleted(organisation)
+        # Members may no longer hold a role which a requirement applies to
+        schedule_compliance_refresh(organisation.id)
+
+
+def split_requirement_courses(requirements):
+    """
+    Attach the primary course, alternative courses and roles to each requirement.
+    Courses and roles must already be prefetched so no further queries are run.
+    """
+    for requirement in requirements:
+        courses = requirement.courses.all()
+        # The primary document is the course the requirement is named after
+        requirement.primary_course = next((course for course in courses if course.title == requirement.name), None)
+        requirement.alternatives = [course for course in courses if course.title != requirement.name]
+        requirement.role_list = list(requirement.roles.all())
+    return requirements
+
+
+class OrgRequirements(ReplicaRoutingMixin, RequirementsNavbarMixin, OrgContextMixin, OrgQuerysetMixin,
+                      generic.ListView):
     """
     List requirements for an organisation.
     """
@@ -298,8 +525,19 @@ class OrgRequirements(RequirementsNavbarMixin, OrgContextMixin, OrgQuerysetMixin
     template_name = 'flamingo/organisations/org_requirements.html'
     ordering = ['name']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return queryset.prefetch_related('courses', 'roles')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Only evaluated if the cached requirements table has to be rendered again
+        context['requirements'] = SimpleLazyObject(lambda: split_requirement_courses(list(context['object_list'])))
+        return context
+
 
-class ViewRequirement(OrgContextMixin, RequirementsNavbarMixin, generic.DetailView):
+class ViewRequirement(ReplicaRoutingMixin, OrgConditionalGetMixin, OrgContextMixin, OrgQuerysetMixin,
+                      RequirementsNavbarMixin, generic.DetailView):
     """
     View a requirement within an organisation.
     """
@@ -308,8 +546,17 @@ class ViewRequirement(OrgContextMixin, RequirementsNavbarMixin, generic.DetailVi
     context_object_name = 'requirement'
     pk_url_kwarg = 'requirement_pk'
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return queryset.prefetch_related('courses', 'roles')
+
+    def get_context_data(self, **kwargs):
+        split_requirement_courses([self.object])
+        return super().get_context_data(**kwargs)
 
-class DeleteRequirement(OrgContextMixin, RequirementsNavbarMixin, generic.DeleteView):
+
+class DeleteRequirement(ReplicaRoutingMixin, OrgVersionMixin, OrgContextMixin, OrgQuerysetMixin,
+                        RequirementsNavbarMixin, generic.DeleteView):
     """
     Delete a requirement from an organisation.
     """
@@ -322,29 +569,35 @@ class DeleteRequirement(OrgContextMixin, RequirementsNavbarMixin, generic.Delete
         return url
 
 
+@replica_routing
+def export_requirements(request, pk):
+    """
+    Stream the requirements of an organisation as CSV or JSON.
+    """
+    org = get_organisation(request, pk)
+    return export_response(request, 'requirements', REQUIREMENT_COLUMNS, requirement_rows(org))
+
+
+@replica_routing
 def add_requirement(request, pk):
     """
     Add a requirement.
     """
-    org = Organisation.objects.get(pk=pk)
+    org = get_organisation(request, pk)
     if request.method == 'POST':
         form = AddRequirementForm(org=org, data=request.POST)
         if form.is_valid():
             req = RoleRequirements()
             primary = Course.objects.get(pk=form.cleaned_data['primary'])
-            # Set requirement name to title of primary document
-            req.name = primary.title
-            req.organisation = org
-            req.save()
-            # Add roles to the requirement object
-            for role in form.cleaned_data['roles']:
-                req.roles.add(role)
-            # Add primary document to associated courses
-            req.courses.add(primary)
-            # Add alternatives to associated courses
-            for alternative in form.cleaned_data['alternatives']:
-                req.courses.add(alternative)
-            req.save()
+            with transaction.atomic():
+                # Set requirement name to title of primary document
+                req.name = primary.title
+                req.organisation = org
+                req.save()
+                # Add roles, the primary document and its alternatives in one insert each
+                req.roles.add(*[int(role_id) for role_id in form.cleaned_data['roles']])
+                req.courses.add(primary.id, *{int(course_id) for course_id in form.cleaned_data['alternatives']})
+            bump_organisation_version(org.id)
             return HttpResponseRedirect(reverse('flamingo:org-requirements', args=[pk]))
         else:
             # TODO: Produce an error msg
@@ -359,12 +612,13 @@ def add_requirement(request, pk):
     return render(request, 'flamingo/organisations/org_requirement_add.html', context)
 
 
+@replica_routing
 def edit_requirement(request, pk, requirement_pk):
     """
     Edit a requirement.
     """
-    org = Organisation.objects.get(pk=pk)
-    req = RoleRequirements.objects.get(pk=requirement_pk)
+    org = get_organisation(request, pk)
+    req = get_object_or_404(RoleRequirements, pk=requirement_pk, organisation=org)
     primary = Course.objects.get(title=req.name)
     # Get initial requirement data to render the form
     req_roles_ids = list(req.roles.all().values_list('id', flat=True))
@@ -378,25 +632,16 @@ def edit_requirement(request, pk, requirement_pk):
         form = EditRequirementForm(org=org, data=request.POST, current_req=req)
         if form.is_valid():
             primary = Course.objects.get(pk=form.cleaned_data['primary'])
-            # Set requirement name to title of primary document
-            req.name = primary.title
-            req.organisation = org
-            req.save()
-            # Remove all roles from requirement
-            for role in req.roles.all():
-                req.roles.remove(role)
-            # Remove all courses from requirement
-            for course in req.courses.all():
-                req.courses.remove(course)
-            # Add roles to the requirement object
-            for role in form.cleaned_data['roles']:
-                req.roles.add(role)
-            # Add primary document to associated courses
-            req.courses.add(primary)
-            # Add alternatives to associated courses
-            for alternative in form.cleaned_data['alternatives']:
-                req.courses.add(alternative)
-            req.save()
+            courses = {primary.id} | {int(course_id) for course_id in form.cleaned_data['alternatives']}
+            with transaction.atomic():
+                # Set requirement name to title of primary document
+                req.name = primary.title
+                req.organisation = org
+                req.save()
+                # set() only deletes the links which were deselected and inserts the new ones
+                req.roles.set([int(role_id) for role_id in form.cleaned_data['roles']])
+                req.courses.set(courses)
+            bump_organisation_version(org.id)
             return HttpResponseRedirect(reverse('flamingo:org-requirements', args=[pk]))
         else:
             # TODO: Produce an error msg
@@ -412,7 +657,36 @@ def edit_requirement(request, pk, requirement_pk):
     return render(request, 'flamingo/organisations/org_requirement_edit.html', context)
 
 
-class ListRoles(RolesNavbarMixin, OrgContextMixin, generic.ListView):
+class OrgCompliance(ReplicaRoutingMixin, ComplianceNavbarMixin, OrgContextMixin, TemplateView):
+    """
+    Show which requirements each member of an organisation meets, read from the compliance snapshot.
+    """
+    template_name = 'flamingo/organisations/org_compliance.html'
+    paginate_by = 50
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        organisation = context['organisation']
+        # Only one page of members and their statuses is read
+        paginator = Paginator(compliance_members(organisation), self.paginate_by)
+        try:
+            page = paginator.page(self.request.GET.get('page', 1))
+        except PageNotAnInteger:
+            page = paginator.page(1)
+        except EmptyPage:
+            page = paginator.page(paginator.num_pages)
+        matrix = snapshot_matrix(organisation, page.object_list, paginator.count)
+        context.update({
+            'matrix': matrix,
+            'rows': matrix.rows,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+        })
+        return context
+
+
+class ListRoles(ReplicaRoutingMixin, RolesNavbarMixin, OrgContextMixin, KeysetPaginationMixin, generic.ListView):
     """
     List roles within an organisation
     """
@@ -425,14 +699,16 @@ class ListRoles(RolesNavbarMixin, OrgContextMixin, generic.ListView):
         queryset = super().get_queryset()
         org_id = self.kwargs['pk']
         queryset = queryset.filter(organisation=org_id)
+        queryset = queryset.prefetch_related('role_requirements').annotate(member_count=Count('members'))
         return queryset.order_by('id')
 
 
+@replica_routing
 def add_role(request, pk):
     """
     Add a role.
     """
-    org = Organisation.objects.get(pk=pk)
+    org = get_organisation(request, pk)
     if request.method == 'POST':
         role_form = AddRoleForm(data=request.POST)
         req_form = SelectRoleRequirementsForm(org=org, data=request.POST)
@@ -440,10 +716,10 @@ def add_role(request, pk):
             role = Role()
             role.name = role_form.cleaned_data['name']
             role.organisation = org
-            role.save()
-            for req_id in req_form.cleaned_data['requirements']:
-                req = RoleRequirements.objects.get(pk=req_id)
-                req.roles.add(role)
+            with transaction.atomic():
+                role.save()
+                role.role_requirements.add(*[int(req_id) for req_id in req_form.cleaned_data['requirements']])
+            bump_organisation_version(org.id)
             return HttpResponseRedirect(reverse('flamingo:org-roles', args=[pk]))
         else:
             HttpResponse("form invalid")
@@ -459,12 +735,13 @@ def add_role(request, pk):
     return render(request, 'flamingo/organisations/org_role_add.html', context)
 
 
+@replica_routing
 def edit_role(request, pk, role_pk):
     """
     Edit a role.
     """
-    org = Organisation.objects.get(pk=pk)
-    role = Role.objects.get(pk=role_pk)
+    org = get_organisation(request, pk)
+    role = get_object_or_404(Role, pk=role_pk, organisation=org)
     reqs = role.role_requirements.all()
     # List of IDs for current requirements to pre-fill form
     reqs_ids = list(reqs.values_list('id', flat=True))
@@ -474,14 +751,11 @@ def edit_role(request, pk, role_pk):
         req_form = SelectRoleRequirementsForm(org=org, data=request.POST)
         if role_form.is_valid() and req_form.is_valid():
             role.name = role_form.cleaned_data['name']
-            role.save()
-            # Remove role from all requirements in org
-            for req in reqs:
-                req.roles.remove(role)
-            # Add the role only to the requirements that are selcted
-            for req_id in req_form.cleaned_data['requirements']:
-                req = RoleRequirements.objects.get(pk=req_id)
-                req.roles.add(role)
+            with transaction.atomic():
+                role.save()
+                # Link the role only to the requirements that are selected, touching just the changes
+                role.role_requirements.set([int(req_id) for req_id in req_form.cleaned_data['requirements']])
+            bump_organisation_version(org.id)
             return HttpResponseRedirect(reverse('flamingo:org-role', args=[pk, role_pk]))
         else:
             HttpResponse("form invalid")
@@ -498,7 +772,8 @@ def edit_role(request, pk, role_pk):
     return render(request, 'flamingo/organisations/org_role_edit.html', context)
 
 
-class ViewRole(OrgContextMixin, RolesNavbarMixin, generic.DetailView):
+class ViewRole(ReplicaRoutingMixin, RoleConditionalGetMixin, OrgContextMixin, OrgQuerysetMixin, RolesNavbarMixin,
+               generic.DetailView):
     """
     View a role within an organisation
     """
@@ -508,7 +783,8 @@ class ViewRole(OrgContextMixin, RolesNavbarMixin, generic.DetailView):
     pk_url_kwarg = 'role_pk'
 
 
-class DeleteRole(OrgContextMixin, RolesNavbarMixin, generic.DeleteView):
+class DeleteRole(ReplicaRoutingMixin, OrgVersionMixin, OrgContextMixin, OrgQuerysetMixin, RolesNavbarMixin,
+                 generic.DeleteView):
     """
     Delete a role from an organisation.
     """
@@ -524,7 +800,7 @@ class DeleteRole(OrgContextMixin, RolesNavbarMixin, generic.DeleteView):
         return url
 
 
-class UserList(generic.ListView):
+class UserList(ReplicaRoutingMixin, KeysetPaginationMixin, generic.ListView):
     """
     List users and filter by a search term.
     """
@@ -535,15 +811,14 @@ class UserList(generic.ListView):
 
     def get_queryset(self):
         queryset = super().get_queryset()
+        queryset = queryset.order_by('last_name')
         query = self.request.GET.get('usr')
         if query is not None:
-            queryset = User.objects.filter((Q(first_name__icontains=query)
-                                            | Q(last_name__icontains=query)
-                                            | Q(email__icontains=query)))
-        return queryset.order_by('last_name')
+            queryset = search(queryset, query, ['first_name', 'last_name', 'email'])
+        return queryset
 
 
-class UserDetails(generic.DetailView):
+class UserDetails(ReplicaRoutingMixin, UserConditionalGetMixin, generic.DetailView):
     """
     Display the details of a specific user.
     """
@@ -551,44 +826,59 @@ class UserDetails(generic.DetailView):
     template_name = 'flamingo/users/user_details.html'
 
 
-class UserDocuments(generic.DetailView):
+class UserDocuments(ReplicaRoutingMixin, UserConditionalGetMixin, generic.DetailView):
     """
     Display the documents (qualifications) held by a specific user.
     """
     model = User
     template_name = 'flamingo/users/user_documents.html'
+    # Expiry is shown as the time until each qualification expires
+    daily = True
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Datetime used to calculate time until qualifications expire
         context['time'] = datetime.now()
 
-        # Get the user, and all qualification the user holds
-        usr = User.objects.get(pk=self.kwargs['pk'])
-
-        # Key stores the org, and value stores an array of quals visible to that org
-        tabs = {}
-
-        # Creating a tab which shows all the user's qualifications
-        tabs['All'] = [[qualification] for qualification in Qualification.objects.filter(user=usr).all()]
-
-        # Look at each organisation which a user is in
-        for membership in usr.memberships.all():
-            org_tab = ([[qualification] for qualification
-                        in Qualification.objects.filter(organisations=membership.organisation).all()])
-            # Add it to that key (ie. that org tab)
-            tabs[membership.organisation.name] = org_tab
-
-        # Showing qualifications that are only visible to the user
-        tabs['Only Me'] = ([[qualification] for qualification in
-                            Qualification.objects.filter(organisations=None, user=usr).all()])
+        # Every qualification the user holds, with its course and visibility loaded in bulk
+        qualifications = (Qualification.objects.filter(user=self.object)
+                          .select_related('course')
+                          .prefetch_related('organisations'))
+        memberships = self.object.memberships.select_related('organisation')
+
+        # Key stores the org, and value stores a list of quals visible to that org
+        tabs = OrderedDict()
+        tabs['All'] = []
+        for membership in memberships:
+            tabs[membership.organisation.name] = []
+        tabs['Only Me'] = []
+        org_tabs = {membership.organisation_id: tabs[membership.organisation.name] for membership in memberships}
+
+        # Sort each qualification into the tabs of the organisations it is visible to
+        for qualification in qualifications:
+            tabs['All'].append(qualification)
+            visible_to = [organisation.id for organisation in qualification.organisations.all()]
+            if not visible_to:
+                tabs['Only Me'].append(qualification)
+            for org_id in visible_to:
+                if org_id in org_tabs:
+                    org_tabs[org_id].append(qualification)
 
         # Add this dictionary to context
         context['tabs'] = tabs
         return context
 
 
-class UserEditDetails(generic.UpdateView):
+@replica_routing
+def export_documents(request, pk):
+    """
+    Stream the documents (qualifications) held by a user as CSV or JSON.
+    """
+    usr = get_object_or_404(User, pk=pk)
+    return export_response(request, 'documents', QUALIFICATION_COLUMNS, qualification_rows(usr))
+
+
+class UserEditDetails(ReplicaRoutingMixin, OrgVersionMixin, generic.UpdateView):
     """
     Edit the details of a user.
     """
@@ -596,12 +886,16 @@ class UserEditDetails(generic.UpdateView):
     fields = ['first_name', 'middle_name', 'last_name', 'email', 'phone', 'date_of_birth']
     template_name = 'flamingo/users/user_details_edit.html'
 
+    def get_version_organisations(self):
+        # The user's details are listed in the members table of every organisation they belong to
+        return self.object.memberships.values_list('organisation_id', flat=True)
+
     def get_success_url(self, *args, **kwargs):
         user_id = self.request.POST.get('usr_pk')
         return reverse('flamingo:user-details', args=[user_id])
 
 
-class UserEditDocuments(generic.UpdateView):
+class UserEditDocuments(ReplicaRoutingMixin, generic.UpdateView):
     """
     Edit a document belonging to a user
     """
@@ -621,7 +915,24 @@ class UserEditDocuments(generic.UpdateView):
         return context
 
 
-class CurriculumList(generic.ListView):
+def curriculum_holders(curriculum):
+    """
+    Users holding a qualification for the course of a curriculum from its provider.
+    """
+    qualifications = Qualification.objects.filter(course=curriculum.course_id, provider=curriculum.provider_id)
+    return User.objects.filter(id__in=qualifications.values('user_id'))
+
+
+def holder_count():
+    """
+    Expression counting the users who hold each curriculum, computed per row in a subquery.
+    """
+    holders = (Qualification.objects.filter(course=OuterRef('course'), provider=OuterRef('provider'))
+               .order_by().values('course').annotate(count=Count('user', distinct=True)).values('count'))
+    return Coalesce(Subquery(holders, output_field=IntegerField()), 0)
+
+
+class CurriculumList(ReplicaRoutingMixin, KeysetPaginationMixin, generic.ListView):
     """
     List curriculums and filter by a search term.
     """
@@ -632,34 +943,42 @@ class CurriculumList(generic.ListView):
 
     def get_queryset(self):
         queryset = super().get_queryset()
+        queryset = queryset.select_related('course', 'provider').annotate(holder_count=holder_count())
+        queryset = queryset.order_by('id')
         query = self.request.GET.get('search')
         if query is not None:
-            queryset = Curriculum.objects.filter(Q(course__title__icontains=query)
-                                                 | Q(provider__name__icontains=query))
+            queryset = search(queryset, query, ['course__title', 'provider__name'])
         return queryset
 
 
-class CurriculumDetails(generic.DetailView):
+class CurriculumDetails(ReplicaRoutingMixin, generic.DetailView):
     """
     View details of a specific curriculum
     """
     model = Curriculum
     context_object_name = 'curriculum'
     template_name = 'flamingo/curriculums/curriculums_details.html'
+    paginate_by = 50
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('course', 'provider')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        curriculum = Curriculum.objects.get(pk=self.kwargs['pk'])
-        context['curriculum'] = curriculum
-
-        # Get the users associated with a qualification
-        users = ([qualification.user for qualification in
-                 Qualification.objects.filter(course=curriculum.course, provider=curriculum.provider)])
-        context['users'] = users
+        # Holders are listed a page at a time, without counting them all
+        holders = (curriculum_holders(self.object).only('first_name', 'last_name', 'email')
+                   .order_by('last_name', 'first_name', 'id'))
+        paginator, page = paginate(holders, self.paginate_by, self.request.GET.get('page'))
+        context.update({
+            'users': page.object_list,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+        })
         return context
 
 
-class CurriculumAdd(generic.CreateView):
+class CurriculumAdd(ReplicaRoutingMixin, generic.CreateView):
     """
     Add a curriculum, using a pre-existing course and provider pair.
     """
@@ -671,7 +990,7 @@ class CurriculumAdd(generic.CreateView):
         return reverse('flamingo:curriculums-list')
 
 
-class CourseList(generic.ListView):
+class CourseList(ReplicaRoutingMixin, KeysetPaginationMixin, generic.ListView):
     """
     List course and filter by a search term.
     """
@@ -682,13 +1001,14 @@ class CourseList(generic.ListView):
 
     def get_queryset(self):
         queryset = super().get_queryset()
+        queryset = queryset.order_by('id')
         query = self.request.GET.get('search')
         if query is not None:
-            queryset = Course.objects.filter(Q(title__icontains=query))
+            queryset = search(queryset, query, ['title'])
         return queryset
 
 
-class ProviderList(generic.ListView):
+class ProviderList(ReplicaRoutingMixin, KeysetPaginationMixin, generic.ListView):
     """
     List provider and filter by a search term.
     """
@@ -699,13 +1019,14 @@ class ProviderList(generic.ListView):
 
     def get_queryset(self):
         queryset = super().get_queryset()
+        queryset = queryset.order_by('id')
         query = self.request.GET.get('search')
         if query is not None:
-            queryset = Provider.objects.filter(Q(name__icontains=query))
+            queryset = search(queryset, query, ['name'])
         return queryset
 
 
-class CourseEdit(generic.UpdateView):
+class CourseEdit(ReplicaRoutingMixin, OrgVersionMixin, generic.UpdateView):
     """
     Edit a course title
     """
@@ -714,11 +1035,16 @@ class CourseEdit(generic.UpdateView):
     template_name = 'flamingo/courses/courses_edit.html'
     pk_url_kwarg = 'course_pk'
 
+    def get_version_organisations(self):
+        # Course titles are shown in the requirements tables of organisations which require them
+        return (RoleRequirements.objects.filter(courses=self.object)
+                .values_list('organisation_id', flat=True).distinct())
+
     def get_success_url(self, *args, **kwargs):
         return reverse('flamingo:courses-list')
 
 
-class CourseAdd(generic.CreateView):
+class CourseAdd(ReplicaRoutingMixin, generic.CreateView):
     """
     Add a course
     """
@@ -730,7 +1056,7 @@ class CourseAdd(generic.CreateView):
         return reverse('flamingo:courses-list')
 
 
-class ProviderEdit(generic.UpdateView):
+class ProviderEdit(ReplicaRoutingMixin, generic.UpdateView):
     """
     Edit a provider name
     """
@@ -743,7 +1069,7 @@ class ProviderEdit(generic.UpdateView):
         return reverse('flamingo:providers-list')
 
 
-class ProviderAdd(generic.CreateView):
+class ProviderAdd(ReplicaRoutingMixin, generic.CreateView):
     """
     Add a provider
     """
@@ -753,3 +1079,15 @@ class ProviderAdd(generic.CreateView):
 
     def get_success_url(self, *args, **kwargs):
         return reverse('flamingo:providers-list')
+
+
+@staff_member_required
+def slow_requests(request):
+    """
+    List the slow requests recorded by SlowRequestMiddleware, newest first. Posting clears them.
+    """
+    if request.method == 'POST':
+        profiling.clear_slow_requests()
+        return HttpResponseRedirect(reverse('flamingo:slow-requests'))
+    return render(request, 'flamingo/slow_requests.html', {'slow_requests': profiling.slow_requests(),
+                                                           'threshold': profiling.threshold()})